@@ -0,0 +1,264 @@
+"""
+Runs the labelled messages of training_samples.json (and optional extra cases) through one or more
+models, quantizations, context sizes and thread counts and reports the field accuracy, the end-to-end
+tokens per second (completion tokens over the whole request, prompt evaluation included), the
+p50/p95 latency and the peak memory of every combination.
+Every combination runs in its own process, so the peak memory of one model does not hide the next one.
+Run it from the repository root, e.g.
+`python benchmarks/extraction_benchmark.py --model ./gemma-2-9b-it-q5_0.gguf --model ./gemma-2-2b-it-q4_k_m.gguf --threads 4 8`.
+Extra cases are a JSON list like [{"message": "...", "expected": {"name": "...", "preis": 100, "stadt": "...", "radius": 10}}],
+with "expected": null for messages that miss information.
+"""
+
+import argparse
+import itertools
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+TRAINING_SAMPLES = Path(__file__).resolve().parent.parent / "training_samples.json"
+FIELDS = ["item_name", "price_limit", "location", "radius"]
+
+
+@dataclass(slots=True)
+class RunResult:
+    model: str
+    n_ctx: int
+    threads: int | None
+    samples: int
+    load_time: float
+    correct_fields: dict[str, int]
+    labelled_samples: int
+    exact_matches: int
+    correct_rejections: int
+    unlabelled_samples: int
+    completion_tokens: int
+    request_time: float
+    latencies: list[float]
+    peak_rss_mb: float
+
+
+def normalize_text(value: str) -> str:
+    for umlaut, replacement in (("ä", "ae"), ("ö", "oe"), ("ü", "ue"), ("ß", "ss")):
+        value = value.lower().replace(umlaut, replacement)
+    return " ".join(value.replace("-", " ").split())
+
+
+def parse_label(content: str) -> dict | None:
+    content = content.strip().removesuffix("+++")
+    if content == "None":
+        return None
+    label = json.loads("{" + content.replace("'", '"').lstrip("{"))
+    return {
+        "item_name": normalize_text(label["name"]),
+        "price_limit": int(label["preis"]),
+        "location": normalize_text(label["stadt"]),
+        "radius": int(label["radius"]),
+    }
+
+
+def load_samples(
+    training_samples: Path, extra_samples: list[Path]
+) -> list[tuple[str, dict | None]]:
+    """Pairs every example request with its expected fields, None if the message misses information."""
+    from ebayscraper.src.utils.machine_learning import MESSAGES
+
+    # Messages that are part of the few-shot prompt would only measure how well the model copies.
+    prompt_messages = {message["content"] for message in MESSAGES if message["role"] == "user"}
+    with open(training_samples, "r") as file:
+        messages = json.load(file)
+    samples = [
+        (user_message["content"], parse_label(answer["content"]))
+        for user_message, answer in zip(messages[2::2], messages[3::2])
+    ]
+    for path in extra_samples:
+        with open(path, "r") as file:
+            for case in json.load(file):
+                expected = case["expected"]
+                samples.append(
+                    (
+                        case["message"],
+                        (
+                            None
+                            if expected is None
+                            else parse_label(json.dumps(expected, ensure_ascii=False))
+                        ),
+                    )
+                )
+    return [(message, label) for message, label in samples if message not in prompt_messages]
+
+
+def run_combination(
+    model_path: str,
+    n_ctx: int,
+    threads: int | None,
+    samples: list[tuple[str, dict | None]],
+    use_prefix_state: bool,
+) -> RunResult:
+    """Loads the model into this process and extracts every sample once."""
+    from ebayscraper.src.utils import machine_learning
+
+    start = time.perf_counter()
+    model = machine_learning.load_model(model_path=model_path, n_ctx=n_ctx, n_threads=threads)
+    if use_prefix_state:
+        machine_learning.load_prefix_state(f"{model_path}.ctx{n_ctx}.prefix-state")
+    load_time = time.perf_counter() - start
+
+    # The extraction only returns the parsed fields, the token counts are taken from the response.
+    usages: list[dict] = []
+    create_chat_completion = model.create_chat_completion
+
+    def create_chat_completion_with_usage(*args, **kwargs):
+        response = create_chat_completion(*args, **kwargs)
+        usages.append(response.get("usage", {}))
+        return response
+
+    model.create_chat_completion = create_chat_completion_with_usage
+
+    result = RunResult(
+        model=Path(model_path).name,
+        n_ctx=n_ctx,
+        threads=threads,
+        samples=len(samples),
+        load_time=load_time,
+        correct_fields={field: 0 for field in FIELDS},
+        labelled_samples=0,
+        exact_matches=0,
+        correct_rejections=0,
+        unlabelled_samples=0,
+        completion_tokens=0,
+        request_time=0.0,
+        latencies=[],
+        peak_rss_mb=0.0,
+    )
+    for message, label in samples:
+        start = time.perf_counter()
+        search_values = machine_learning.extract_search_values_with_ml(
+            chat_id=0, chat_message=message
+        )
+        latency = time.perf_counter() - start
+        result.latencies.append(latency)
+        result.request_time += latency
+        if usages:
+            result.completion_tokens += usages[-1].get("completion_tokens", 0)
+            usages.clear()
+
+        if label is None:
+            result.unlabelled_samples += 1
+            result.correct_rejections += search_values is None
+            continue
+        result.labelled_samples += 1
+        if search_values is None:
+            continue
+        values = {
+            "item_name": normalize_text(str(search_values.item_name)),
+            "price_limit": search_values.price_limit,
+            "location": normalize_text(str(search_values.location)),
+            "radius": int(search_values.radius),
+        }
+        for field in FIELDS:
+            result.correct_fields[field] += values[field] == label[field]
+        result.exact_matches += values == label
+
+    # ru_maxrss is reported in KiB on Linux.
+    result.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def run_in_subprocess(
+    args: argparse.Namespace, model_path: str, n_ctx: int, threads: int | None
+) -> RunResult | None:
+    command = [
+        sys.executable,
+        __file__,
+        "--worker",
+        "--model",
+        model_path,
+        "--n-ctx",
+        str(n_ctx),
+        "--samples",
+        str(args.samples),
+    ]
+    if threads is not None:
+        command += ["--threads", str(threads)]
+    for path in args.extra_samples:
+        command += ["--extra-samples", str(path)]
+    if args.limit is not None:
+        command += ["--limit", str(args.limit)]
+    if args.prefix_state:
+        command.append("--prefix-state")
+    completed_process = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    if completed_process.returncode != 0:
+        print(f"{Path(model_path).name} (n_ctx {n_ctx}, threads {threads}) failed", file=sys.stderr)
+        return None
+    return RunResult(**json.loads(completed_process.stdout.splitlines()[-1]))
+
+
+def print_results(results: list[RunResult]) -> None:
+    print(
+        f"{'model':<32} {'n_ctx':>6} {'threads':>7} {'load':>7} "
+        + " ".join(f"{field:>11}" for field in FIELDS)
+        + f" {'exact':>7} {'none':>7} {'e2e tok/s':>9} {'p50':>7} {'p95':>7} {'peak RSS':>10}"
+    )
+    for result in results:
+        latencies = sorted(result.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        tokens_per_second = (
+            result.completion_tokens / result.request_time if result.request_time else 0.0
+        )
+        labelled = max(result.labelled_samples, 1)
+        print(
+            f"{result.model:<32} {result.n_ctx:>6} {str(result.threads or 'auto'):>7} "
+            f"{result.load_time:>6.1f}s "
+            + " ".join(f"{result.correct_fields[field] / labelled:>11.0%}" for field in FIELDS)
+            + f" {result.exact_matches / labelled:>7.0%}"
+            f" {result.correct_rejections}/{result.unlabelled_samples:<5}"
+            f" {tokens_per_second:>9.1f}"
+            f" {statistics.median(latencies) if latencies else 0.0:>6.2f}s {p95:>6.2f}s"
+            f" {result.peak_rss_mb:>7.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--model", action="append", help="GGUF file, can be given several times.")
+    parser.add_argument("--n-ctx", type=int, nargs="+", default=[2048])
+    parser.add_argument("--threads", type=int, nargs="+", default=[None])
+    parser.add_argument("--samples", type=Path, default=TRAINING_SAMPLES)
+    parser.add_argument("--extra-samples", type=Path, action="append", default=[])
+    parser.add_argument("--limit", type=int, help="Only use the first N samples.")
+    parser.add_argument(
+        "--prefix-state",
+        action="store_true",
+        help="Restore the evaluated few-shot prompt when the model is loaded, like the bot does.",
+    )
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples, args.extra_samples)[: args.limit]
+    if args.worker:
+        result = run_combination(
+            model_path=args.model[0],
+            n_ctx=args.n_ctx[0],
+            threads=args.threads[0],
+            samples=samples,
+            use_prefix_state=args.prefix_state,
+        )
+        print(json.dumps(asdict(result)))
+        sys.exit(0)
+
+    models = args.model or ["./gemma-2-9b-it-q5_0.gguf"]
+    print(f"{len(samples)} samples (examples of the few-shot prompt are left out)")
+    results = []
+    for model_path, n_ctx, threads in itertools.product(models, args.n_ctx, args.threads):
+        result = run_in_subprocess(args, model_path, n_ctx, threads)
+        if result is not None:
+            results.append(result)
+    print_results(results)
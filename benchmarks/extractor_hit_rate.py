@@ -0,0 +1,85 @@
+"""
+Measures how many messages of training_samples.json are handled by the layers in front of the LLM
+and how accurate their fields are compared to the labelled answers.
+Run it from the repository root (it needs the config.json of the bot), e.g. `python benchmarks/extractor_hit_rate.py`.
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "ebayscraper" / "src"))
+
+from ebayscraper.src.classes import SearchRequest  # noqa: E402
+from utils.utils import parse_with_rules, replace_umlauts  # noqa: E402
+
+TRAINING_SAMPLES = Path(__file__).resolve().parent.parent / "training_samples.json"
+FIELDS = ["item_name", "price_limit", "location", "radius"]
+
+
+def load_labelled_samples(path: Path) -> list[tuple[str, SearchRequest | None]]:
+    """Pairs every example request with the answer of the assistant, None if the answer is 'None'."""
+    with open(path, "r") as file:
+        messages = json.load(file)
+    samples = []
+    # The first two messages are the instruction and its confirmation.
+    for user_message, answer in zip(messages[2::2], messages[3::2]):
+        content = answer["content"].strip().removesuffix("+++")
+        if content == "None":
+            samples.append((user_message["content"], None))
+            continue
+        label = json.loads("{" + content.replace("'", '"').lstrip("{"))
+        samples.append(
+            (
+                user_message["content"],
+                SearchRequest(
+                    chat_id=0,
+                    item_name=replace_umlauts(label["name"].lower()),
+                    price_limit=int(label["preis"]),
+                    location=replace_umlauts(label["stadt"].lower()),
+                    radius=int(label["radius"]),
+                ),
+            )
+        )
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=Path, default=TRAINING_SAMPLES)
+    parser.add_argument("--verbose", action="store_true", help="Print every mismatch.")
+    args = parser.parse_args()
+
+    samples = load_labelled_samples(args.samples)
+    layer_counts: Counter[str] = Counter()
+    correct_fields: Counter[str] = Counter()
+    false_positives = 0
+    for message, label in samples:
+        layer, search_values = parse_with_rules(chat_id=0, chat_message=f"/add {message}")
+        layer_counts[layer] += 1
+        if search_values is None:
+            continue
+        if label is None:
+            false_positives += 1
+            if args.verbose:
+                print(f"Expected no result for '{message}', got {search_values}")
+            continue
+        for field in FIELDS:
+            if getattr(search_values, field) == getattr(label, field):
+                correct_fields[field] += 1
+            elif args.verbose:
+                print(
+                    f"{field} of '{message}': {getattr(search_values, field)!r} != {getattr(label, field)!r}"
+                )
+
+    print(f"{len(samples)} messages")
+    for layer in ["schema", "rules", "llm"]:
+        print(f"{layer:<7} {layer_counts[layer]:>4} ({layer_counts[layer] / len(samples):.0%})")
+    handled = layer_counts["schema"] + layer_counts["rules"]
+    print(f"LLM calls saved: {handled} of {len(samples)}")
+    print(f"Results for messages without all information: {false_positives}")
+    print("Field accuracy of the results without the LLM:")
+    for field in FIELDS:
+        print(f"  {field:<12} {correct_fields[field]}/{handled - false_positives}")
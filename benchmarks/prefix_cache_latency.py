@@ -0,0 +1,81 @@
+"""
+Compares the per-request latency of the LLM extraction in three situations:
+the first request after a restart without the saved prompt prefix state (cold), the first request
+after a restart with the restored state, and requests in a running process, where llama.cpp already
+reuses the evaluated few-shot prompt of the previous request (warm).
+Run it from the repository root, e.g. `python benchmarks/prefix_cache_latency.py --requests 10`.
+"""
+
+import argparse
+import json
+import statistics
+import time
+from collections.abc import Callable
+from pathlib import Path
+from ebayscraper.src.utils import machine_learning
+
+TRAINING_SAMPLES = Path(__file__).resolve().parent.parent / "training_samples.json"
+
+
+def load_user_messages(limit: int) -> list[str]:
+    with open(TRAINING_SAMPLES, "r") as file:
+        samples = json.load(file)
+    # The first message is the instruction, every user message after it is an example request.
+    return [sample["content"] for sample in samples[2:] if sample["role"] == "user"][:limit]
+
+
+def measure(messages: list[str], before_request: Callable[[], None] | None = None) -> list[float]:
+    """Times every request, 'before_request' runs untimed before each of them."""
+    latencies = []
+    for message in messages:
+        if before_request is not None:
+            before_request()
+        start = time.perf_counter()
+        machine_learning.extract_search_values_with_ml(chat_id=0, chat_message=message)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def restart_with_prefix_state(path: str) -> None:
+    machine_learning.load_model().reset()
+    machine_learning.load_prefix_state(path)
+
+
+def print_latencies(name: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name:<22} mean {statistics.mean(latencies):6.2f} s | "
+        f"p50 {statistics.median(latencies):6.2f} s | p95 {p95:6.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model-path", default="./gemma-2-9b-it-q5_0.gguf")
+    parser.add_argument("--n-ctx", type=int, default=2048)
+    parser.add_argument("--prefix-state-path", default="./gemma-2-9b-it-q5_0.prefix-state")
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    messages = load_user_messages(args.requests)
+    model = machine_learning.load_model(model_path=args.model_path, n_ctx=args.n_ctx)
+    # Without the saved state the whole prompt is evaluated, like after every restart.
+    cold = measure(messages, before_request=model.reset)
+
+    start = time.perf_counter()
+    machine_learning.load_prefix_state(args.prefix_state_path)
+    print(f"Preparing the prefix state took {time.perf_counter() - start:.2f} s")
+    restored = measure(
+        messages, before_request=lambda: restart_with_prefix_state(args.prefix_state_path)
+    )
+
+    # The first request evaluates the prompt, every further one reuses it like the running bot.
+    model.reset()
+    measure(messages[:1])
+    warm = measure(messages)
+
+    print(f"{len(messages)} requests")
+    print_latencies("cold", cold)
+    print_latencies("restored prefix state", restored)
+    print_latencies("warm", warm)
@@ -0,0 +1,502 @@
+"""
+Benchmarks the hot paths of the scraper without touching kleinanzeigen.de, Postgres or Telegram.
+The micro benchmarks time find_item_information, parse_price_to_int and the configured parser on
+result pages, either generated ones or the result pages of a traffic archive (see the http section).
+The cycle benchmark runs the stages of background_scraper for every search against a local stub server
+whose pages get new listings at --new-rate, an in-memory stand-in for the database and a fake bot,
+and reports the cycle time, the database queries and HTTP requests per cycle and the peak memory.
+The first cycle sees every listing for the first time, later cycles only the new ones.
+Run it from the repository root (it needs the config.json of the bot), e.g.
+`python benchmarks/scrape_cycle_benchmark.py --searches 200 --subscribers 3 --new-rate 0.05 --cycles 5`.
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import timeit
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "ebayscraper" / "src"))
+
+from aiohttp import web  # noqa: E402
+from bs4 import BeautifulSoup  # noqa: E402
+from ebayscraper.src.classes import Item, SearchRequest  # noqa: E402
+from ebayscraper.src.constants import (  # noqa: E402
+    SCRAPE_URL,
+    TELEGRAM_WORKERS,
+    TELEGRAM_QUEUE_SIZE,
+    TELEGRAM_MAX_ATTEMPTS,
+    LOCATION_NOT_FOUND_TTL,
+)
+import scrape_async  # noqa: E402
+import utils.http_client  # noqa: E402
+import utils.location_cache  # noqa: E402
+import utils.notification_dispatcher  # noqa: E402
+import utils.utils  # noqa: E402
+from utils.http_client import http_client  # noqa: E402
+from utils.item_cache import page_history  # noqa: E402
+from utils.location_cache import LocationCache  # noqa: E402
+from utils.notification_dispatcher import NotificationDispatcher  # noqa: E402
+from utils.parsers import (  # noqa: E402
+    PRICE_CLASS,
+    find_item_information,
+    extract_result_list,
+    result_page_parser,
+    parser_pool,
+)
+from utils.traffic_archive import read_archive  # noqa: E402
+from utils.utils import parse_price_to_int  # noqa: E402
+
+LISTINGS_PER_PAGE = 25  # Like kleinanzeigen.de
+LOCATIONS = 20  # Searches share locations, like the users of one region do
+PAGE_SEGMENT_PATTERN = re.compile(r"seite:(\d+)/")
+
+
+@dataclass(slots=True)
+class Listing:
+    identifier: str
+    name: str
+    price: int
+
+
+def format_price(price: int) -> str:
+    return f"{price:,}".replace(",", ".")  # German thousands separator
+
+
+def render_listing(listing: Listing) -> str:
+    return f"""<li class="ad-listitem"><article class="aditem" data-adid="{listing.identifier}"
+    data-href="/s-anzeige/{listing.name}/{listing.identifier}-173-3331">
+  <div class="aditem-main"><div class="aditem-main--middle">
+    <h2 class="text-module-begin"><a class="ellipsis" href="/s-anzeige/{listing.name}/{listing.identifier}-173-3331">{listing.name}</a></h2>
+    <div class="aditem-main--middle--price-shipping">
+      <p class="{PRICE_CLASS}">
+        {format_price(listing.price)}&nbsp;€ VB</p>
+    </div>
+  </div></div>
+</article></li>"""
+
+
+def render_result_page(listings: list[Listing]) -> str:
+    """Result page markup with the parts the parsers look at, plus a header that changes on every request."""
+    articles = "\n".join(render_listing(listing) for listing in listings)
+    return (
+        f'<!DOCTYPE html><html><head><meta name="csrf-token" content="{random.getrandbits(64):x}">'
+        f"<title>Ergebnisse</title></head><body><header>{'<nav>Kategorien</nav>' * 200}</header>"
+        f'<ul id="srchrslt-adtable" class="itemlist">{articles}</ul>'
+        f"<footer>{'<a href=/impressum>Impressum</a>' * 200}</footer></body></html>"
+    )
+
+
+class StubKleinanzeigen:
+    """
+    Serves result pages and location suggestions on localhost. Every result page is created on its
+    first request and gets new listings on top whenever 'add_new_listings' is called.
+    """
+
+    def __init__(self, new_rate: float, rng: random.Random) -> None:
+        self._new_rate = new_rate
+        self._rng = rng
+        self._listings: dict[str, list[Listing]] = {}
+        self._next_identifier = 2_000_000_000
+        self._location_ids: dict[str, int] = {}
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/s-ort-empfehlungen.json", self._location_suggestions)
+        app.router.add_get("/{path:.*}", self._result_page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}/"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _create_listings(self, count: int, name: str) -> list[Listing]:
+        listings = []
+        for _ in range(count):
+            self._next_identifier += 1
+            listings.append(
+                Listing(
+                    identifier=str(self._next_identifier),
+                    name=name,
+                    price=self._rng.randint(1, 1500),
+                )
+            )
+        return listings
+
+    def add_new_listings(self) -> int:
+        """Puts new listings on top of every page, each slot of a page is new with 'new_rate'."""
+        added = 0
+        for page_key, listings in self._listings.items():
+            new_count = sum(self._rng.random() < self._new_rate for _ in range(LISTINGS_PER_PAGE))
+            name = page_key.rsplit("/", 2)[-2]
+            listings[:0] = self._create_listings(new_count, name)
+            # Keep a few pages, further listings are never requested.
+            del listings[LISTINGS_PER_PAGE * 5 :]
+            added += new_count
+        return added
+
+    async def _result_page(self, request: web.Request) -> web.Response:
+        page_match = PAGE_SEGMENT_PATTERN.search(request.path)
+        page = int(page_match.group(1)) if page_match else 1
+        page_key = PAGE_SEGMENT_PATTERN.sub("", request.path)
+        listings = self._listings.get(page_key)
+        if listings is None:
+            listings = self._create_listings(LISTINGS_PER_PAGE * 5, page_key.rsplit("/", 2)[-2])
+            self._listings[page_key] = listings
+        start = (page - 1) * LISTINGS_PER_PAGE
+        return web.Response(
+            text=render_result_page(listings[start : start + LISTINGS_PER_PAGE]),
+            content_type="text/html",
+        )
+
+    async def _location_suggestions(self, request: web.Request) -> web.Response:
+        location_id = self._location_ids.setdefault(
+            request.query["query"], len(self._location_ids) + 1
+        )
+        return web.json_response({"_0": "Deutschland", f"_{location_id}": request.query["query"]})
+
+
+class InMemoryDatabase:
+    """
+    Stand-in for the database functions the scrape stages use. Counts the queries and optionally
+    waits 'query_latency' seconds per query, like a database on another host.
+    """
+
+    def __init__(self, search_requests: list[SearchRequest], query_latency: float) -> None:
+        self._search_requests = search_requests
+        self._query_latency = query_latency
+        self._item_ids: dict[str, int] = {}
+        self._sent_notifications: set[tuple[int, int]] = set()
+        self.queries = 0
+
+    async def _query(self) -> None:
+        self.queries += 1
+        await asyncio.sleep(self._query_latency)
+
+    async def fetch_for_scraping(self) -> list[tuple]:
+        await self._query()
+        return [
+            (
+                search_request.search_id,
+                search_request.chat_id,
+                search_request.item_name,
+                search_request.price_limit,
+                search_request.location,
+                search_request.radius,
+            )
+            for search_request in self._search_requests
+        ]
+
+    async def add_items_to_db(self, items: list[Item]) -> dict[str, int]:
+        if not items:
+            return {}
+        await self._query()
+        for item in items:
+            self._item_ids.setdefault(item.identifier, len(self._item_ids) + 1)
+        return {item.identifier: self._item_ids[item.identifier] for item in items}
+
+    async def get_unsent_notifications_db(
+        self, candidates: list[tuple[int, int]]
+    ) -> set[tuple[int, int]]:
+        if not candidates:
+            return set()
+        await self._query()
+        return set(candidates) - self._sent_notifications
+
+    async def add_notifications_sent_db(self, notifications: list[tuple[int, int]]) -> None:
+        if not notifications:
+            return
+        await self._query()
+        self._sent_notifications.update(notifications)
+
+
+class FakeBot:
+    """Answers every message right away, so only the work of the bot itself is measured."""
+
+    def __init__(self) -> None:
+        self.messages = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.messages += 1
+
+
+@dataclass(slots=True)
+class CycleResult:
+    cycle: int
+    duration: float
+    result_pages: int
+    new_listings_on_site: int
+    new_listings_found: int
+    http_requests: int
+    queries: int
+    notifications: int
+    peak_rss_mb: float
+    stage_stats: list[str] = field(default_factory=list)
+
+
+def create_search_requests(
+    searches: int, subscribers: int, rng: random.Random
+) -> list[SearchRequest]:
+    search_requests = []
+    for page_index in range(searches):
+        # The subscribers of a result page share the item, the location and the radius.
+        radius = rng.choice([5, 10, 20, 50])
+        for _ in range(subscribers):
+            search_id = len(search_requests) + 1
+            search_requests.append(
+                SearchRequest(
+                    search_id=search_id,
+                    chat_id=search_id,
+                    item_name=f"artikel-{page_index}",
+                    price_limit=rng.randint(100, 1500),
+                    location=f"stadt-{page_index % LOCATIONS}",
+                    radius=radius,
+                )
+            )
+    return search_requests
+
+
+async def run_cycle(db: InMemoryDatabase) -> tuple[int, list[str]]:
+    """Scrapes every result page once, like background_scraper when all pages are due at once."""
+    grouped_requests = scrape_async.group_search_requests(
+        [SearchRequest.from_db(search_tuple=result) for result in await db.fetch_for_scraping()]
+    )
+    finished = asyncio.Event()
+    jobs: list[scrape_async.ScrapeJob] = []
+
+    def on_finished(job: scrape_async.ScrapeJob) -> None:
+        jobs.append(job)
+        if len(jobs) == len(grouped_requests):
+            finished.set()
+
+    pipeline = scrape_async.create_scrape_pipeline(on_finished=on_finished)
+    pipeline.start()
+    try:
+        for fetch_key, subscribers in grouped_requests.items():
+            search_ids = frozenset(search_request.search_id for search_request in subscribers)
+            await pipeline.submit(
+                scrape_async.ScrapeJob(
+                    fetch_key=fetch_key,
+                    subscribers=subscribers,
+                    full_pass=page_history.needs_full_pass(fetch_key, search_ids),
+                )
+            )
+        await finished.wait()
+    finally:
+        stage_stats = str(pipeline).split(" | ")
+        await pipeline.stop()
+    return sum(job.new_items for job in jobs), stage_stats
+
+
+async def benchmark_cycles(args: argparse.Namespace) -> list[CycleResult]:
+    rng = random.Random(args.seed)
+    stub = StubKleinanzeigen(new_rate=args.new_rate, rng=rng)
+    await stub.start()
+    db = InMemoryDatabase(
+        create_search_requests(args.searches, args.subscribers, rng), args.query_latency
+    )
+    bot = FakeBot()
+    # The stages look these names up in their modules at call time.
+    scrape_async.EBAY_KLEINANZEIGEN_URL = f"{stub.base_url}s-"
+    scrape_async.fetch_for_scraping = db.fetch_for_scraping
+    scrape_async.add_items_to_db = db.add_items_to_db
+    scrape_async.get_unsent_notifications_db = db.get_unsent_notifications_db
+    utils.notification_dispatcher.add_notifications_sent_db = db.add_notifications_sent_db
+    utils.location_cache.LOCATION_SUGGESTION_URL = f"{stub.base_url}s-ort-empfehlungen.json?query="
+    temporary_directory = tempfile.TemporaryDirectory()
+    utils.utils.location_cache = LocationCache(
+        path=str(Path(temporary_directory.name) / "location_ids.json"),
+        not_found_ttl=LOCATION_NOT_FOUND_TTL,
+    )
+    # The stub is a single host, the pacing for kleinanzeigen.de would only measure the rate limit.
+    utils.http_client.HTTP_RATE = args.http_rate
+    utils.http_client.HTTP_BURST = args.http_rate
+    # The fake bot has no flood limits, and waiting for them would only measure the limits.
+    notification_dispatcher = NotificationDispatcher(
+        global_rate=1e9,
+        per_chat_rate=1e9,
+        workers=TELEGRAM_WORKERS,
+        queue_size=TELEGRAM_QUEUE_SIZE,
+        max_attempts=TELEGRAM_MAX_ATTEMPTS,
+    )
+    scrape_async.notification_dispatcher = notification_dispatcher
+
+    await http_client.open()
+    notification_dispatcher.start(bot)
+    parser_pool.start()
+    results = []
+    try:
+        for cycle in range(1, args.cycles + 1):
+            new_listings_on_site = stub.add_new_listings() if cycle > 1 else 0
+            http_requests = http_client.stats.requests
+            queries = db.queries
+            start = time.perf_counter()
+            new_listings_found, stage_stats = await run_cycle(db)
+            duration = time.perf_counter() - start
+            await notification_dispatcher.stop()  # Waits until the fake bot got every message
+            results.append(
+                CycleResult(
+                    cycle=cycle,
+                    duration=duration,
+                    result_pages=args.searches,
+                    new_listings_on_site=new_listings_on_site,
+                    new_listings_found=new_listings_found,
+                    http_requests=http_client.stats.requests - http_requests,
+                    queries=db.queries - queries,
+                    notifications=bot.messages,
+                    # ru_maxrss is reported in KiB on Linux.
+                    peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                    stage_stats=stage_stats,
+                )
+            )
+            bot.messages = 0
+            notification_dispatcher.start(bot)
+    finally:
+        await notification_dispatcher.stop()
+        parser_pool.stop()
+        await utils.utils.location_cache.flush()
+        await http_client.close()
+        await stub.stop()
+        temporary_directory.cleanup()
+    return results
+
+
+def load_result_pages(args: argparse.Namespace) -> list[str]:
+    """The result pages of the traffic archive, or generated pages if no archive is given."""
+    if args.archive is not None:
+        pages = [
+            response.text
+            for response in read_archive(args.archive)
+            if response.status == 200
+            and response.url.startswith(SCRAPE_URL)
+            and extract_result_list(response.text)
+        ]
+        if not pages:
+            raise SystemExit(f"{args.archive} contains no result pages.")
+        return pages
+    rng = random.Random(args.seed)
+    return [
+        render_result_page(
+            [
+                Listing(
+                    identifier=str(rng.getrandbits(31)), name="artikel", price=rng.randint(1, 1500)
+                )
+                for _ in range(LISTINGS_PER_PAGE)
+            ]
+        )
+        for _ in range(20)
+    ]
+
+
+def time_per_call(function: Callable[[], object], calls: int, repeat: int) -> float:
+    """Best of 'repeat' runs, in microseconds per call of the benchmarked function."""
+    return min(timeit.repeat(function, number=1, repeat=repeat)) / calls * 1e6
+
+
+def run_micro_benchmarks(pages: list[str], repeat: int) -> None:
+    entries = [
+        entry
+        for html in pages
+        for entry in BeautifulSoup(extract_result_list(html), "html.parser").find_all(
+            "article", {"class": "aditem"}
+        )
+        if entry.has_attr("data-href")
+    ]
+    price_texts = [
+        price_node.text
+        for entry in entries
+        if (price_node := entry.find("p", {"class": PRICE_CLASS})) is not None
+    ]
+    print(f"{len(pages)} result pages, {len(entries)} listings")
+    timings = {
+        "find_item_information": (
+            time_per_call(
+                lambda: [find_item_information(entry) for entry in entries], len(entries), repeat
+            ),
+            "listing",
+        ),
+        "parse_price_to_int": (
+            time_per_call(
+                lambda: [parse_price_to_int(price_text) for price_text in price_texts],
+                len(price_texts),
+                repeat,
+            ),
+            "price",
+        ),
+        f"parse ({result_page_parser.name})": (
+            time_per_call(
+                lambda: [result_page_parser.parse(html) for html in pages], len(pages), repeat
+            ),
+            "page",
+        ),
+    }
+    for name, (microseconds, unit) in timings.items():
+        print(f"{name:<28} {microseconds:>10.1f} µs per {unit}")
+
+
+def print_cycle_results(results: list[CycleResult], verbose: bool) -> None:
+    print(
+        f"{'cycle':>5} {'time':>8} {'pages':>6} {'new':>6} {'found':>6} {'HTTP':>6} "
+        f"{'queries':>8} {'notified':>9} {'peak RSS':>10}"
+    )
+    for result in results:
+        print(
+            f"{result.cycle:>5} {result.duration:>7.2f}s {result.result_pages:>6} "
+            f"{result.new_listings_on_site:>6} {result.new_listings_found:>6} "
+            f"{result.http_requests:>6} {result.queries:>8} {result.notifications:>9} "
+            f"{result.peak_rss_mb:>7.0f} MB"
+        )
+        if verbose:
+            for stage_stats in result.stage_stats:
+                print(f"      {stage_stats}")
+    print(f"Page history: {page_history}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--searches", type=int, default=100, help="Unique result pages.")
+    parser.add_argument(
+        "--subscribers", type=int, default=2, help="Search requests per result page."
+    )
+    parser.add_argument(
+        "--new-rate",
+        type=float,
+        default=0.05,
+        help="Chance that a slot of a result page holds a new listing in the next cycle.",
+    )
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument(
+        "--query-latency", type=float, default=0.0, help="Seconds every database query takes."
+    )
+    parser.add_argument(
+        "--http-rate", type=float, default=1000, help="Requests per second to the stub server."
+    )
+    parser.add_argument("--archive", type=Path, help="Traffic archive for the micro benchmarks.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per micro benchmark.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-cycles", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="Print the stats of every stage.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # The bot logs every request and notification.
+    if not args.skip_micro:
+        run_micro_benchmarks(load_result_pages(args), args.repeat)
+    if not args.skip_cycles:
+        print_cycle_results(asyncio.run(benchmark_cycles(args)), args.verbose)
@@ -69,3 +69,18 @@ class SearchRequest:
             location=search_tuple[4],
             radius=search_tuple[5],
         )
+
+
+@dataclass(slots=True, frozen=True)
+class FetchKey:
+    """
+    Identifies a single result page on kleinanzeigen.de.
+    Search requests of different users that share a FetchKey are scraped only once per cycle.
+    """
+
+    item_name: str
+    location: str
+    radius: int
+
+    def __str__(self) -> str:
+        return f"{self.item_name} in {self.location} within {self.radius} km"
@@ -23,3 +23,91 @@ class Tables:
     ITEMS = loaded_file["tables"]["items"]
     NOTIFICATIONS = loaded_file["tables"]["notifications"]
     SEARCHES = loaded_file["tables"]["searches"]
+
+
+# Optional settings for the shared HTTP client, all values in seconds unless noted otherwise.
+http_config = loaded_file.get("http", {})
+HTTP_TOTAL_TIMEOUT = http_config.get("total_timeout", 30)
+HTTP_CONNECT_TIMEOUT = http_config.get("connect_timeout", 10)
+HTTP_KEEPALIVE_TIMEOUT = http_config.get("keepalive_timeout", 30)
+HTTP_DNS_CACHE_TTL = http_config.get("dns_cache_ttl", 300)
+HTTP_CONNECTION_LIMIT = http_config.get("connection_limit", 100)  # Number of connections
+HTTP_CONNECTION_LIMIT_PER_HOST = http_config.get("connection_limit_per_host", 20)
+HTTP_RATE = http_config.get("rate", 2)  # Sustained requests per second and host
+HTTP_BURST = http_config.get("burst", 5)  # Requests per host that may be sent at once
+HTTP_BACKOFF = http_config.get("backoff", 5)  # First pause after a throttled request
+# Longest pause, also used by the circuit breaker
+HTTP_MAX_BACKOFF = http_config.get("max_backoff", 600)
+# Failures in a row that open the circuit breaker
+HTTP_CIRCUIT_BREAKER_THRESHOLD = http_config.get("circuit_breaker_threshold", 5)
+# "live" sends requests, "record" also appends every response to archive_path, "replay" serves the
+# responses from archive_path instead, replay_speed times faster than they were recorded (0: no delay).
+HTTP_MODE = http_config.get("mode", "live")
+HTTP_ARCHIVE_PATH = http_config.get("archive_path", "./traffic.jsonl.gz")
+HTTP_REPLAY_SPEED = http_config.get("replay_speed", 1)
+
+# Seconds a location that kleinanzeigen.de does not know is remembered before it is looked up again.
+LOCATION_NOT_FOUND_TTL = loaded_file.get("location_not_found_ttl", 6 * 60 * 60)
+
+# Backend that parses the result pages: "auto", "selectolax", "lxml" or "html.parser".
+HTML_PARSER = loaded_file.get("html_parser", "auto")
+
+# Number of ebay identifiers whose item_id is kept in memory to skip database lookups.
+KNOWN_ITEM_CACHE_SIZE = loaded_file.get("known_item_cache_size", 100_000)
+
+# Optional settings for sending notifications within the limits of the Telegram Bot API.
+telegram_config = loaded_file.get("telegram", {})
+TELEGRAM_GLOBAL_RATE = telegram_config.get("global_rate", 25)  # Messages per second for all chats
+TELEGRAM_PER_CHAT_RATE = telegram_config.get("per_chat_rate", 1)  # Messages per second and chat
+TELEGRAM_WORKERS = telegram_config.get("workers", 8)
+TELEGRAM_QUEUE_SIZE = telegram_config.get("queue_size", 10_000)
+TELEGRAM_MAX_ATTEMPTS = telegram_config.get("max_attempts", 5)
+
+# Optional settings for the process that runs the language model.
+llm_config = loaded_file.get("llm", {})
+# Without the LLM only the schema format and the free text rules are understood
+LLM_ENABLED = llm_config.get("enabled", True)
+# Load the model in the background right after startup
+LLM_PRELOAD = llm_config.get("preload", True)
+LLM_MODEL_PATH = llm_config.get("model_path", "./gemma-2-9b-it-q5_0.gguf")
+LLM_N_CTX = llm_config.get("n_ctx", 2048)
+# Evaluated few-shot prompt, restored at startup so the first request is fast. null disables it.
+LLM_PREFIX_STATE_PATH = llm_config.get("prefix_state_path", "./gemma-2-9b-it-q5_0.prefix-state")
+LLM_QUEUE_SIZE = llm_config.get("queue_size", 32)  # Requests that may wait for the model
+LLM_TIMEOUT = llm_config.get("timeout", 60)  # Seconds a request may take including waiting time
+LLM_WORKERS = llm_config.get("workers", 1)  # Processes with their own copy of the model
+LLM_THREADS = llm_config.get("threads", None)  # CPU threads per process, null lets llama.cpp decide
+
+# Optional settings for remembering the search requests the LLM extracted from free text messages.
+extraction_cache_config = loaded_file.get("extraction_cache", {})
+EXTRACTION_CACHE_SIZE = extraction_cache_config.get("size", 10_000)
+EXTRACTION_CACHE_PATH = extraction_cache_config.get("path", None)  # Only kept in memory if null
+
+# Optional bounds in seconds for the adaptive scrape interval of every result page.
+# Pages with new listings are scraped more often, quiet pages less often, starting at scrape_interval.
+scheduler_config = loaded_file.get("scheduler", {})
+SCRAPE_MIN_INTERVAL = scheduler_config.get("min_interval", SCRAPE_INTERVAL / 3)
+SCRAPE_MAX_INTERVAL = scheduler_config.get("max_interval", SCRAPE_INTERVAL * 10)
+SCRAPE_JITTER = scheduler_config.get("jitter", 0.1)  # Each interval varies randomly by up to +-10%
+SCRAPE_CONCURRENCY = scheduler_config.get("concurrency", 8)  # Result pages fetched at the same time
+
+# Optional settings for processing only the new part of a result page.
+# Processing stops after 'known_streak' listings in a row that were already on the page (0 disables this),
+# and every 'full_pass_every'th scrape of a page processes the whole page.
+incremental_config = loaded_file.get("incremental_scrape", {})
+INCREMENTAL_KNOWN_STREAK = incremental_config.get("known_streak", 5)
+INCREMENTAL_FULL_PASS_EVERY = incremental_config.get("full_pass_every", 10)
+
+# Result pages fetched per search at most. Further pages are only fetched while a page has no
+# listings that were already processed, i.e. when more listings appeared than fit on one page.
+PAGINATION_MAX_PAGES = loaded_file.get("max_pages", 1)
+
+# Optional settings for the stages of the scrape pipeline (fetch -> parse -> persist -> notify).
+# The fetch stage runs scheduler.concurrency workers, every queue holds at most 'queue_size' scrapes.
+pipeline_config = loaded_file.get("pipeline", {})
+PIPELINE_QUEUE_SIZE = pipeline_config.get("queue_size", 16)
+PIPELINE_PARSE_WORKERS = pipeline_config.get("parse_workers", 1)
+PIPELINE_PERSIST_WORKERS = pipeline_config.get("persist_workers", 4)
+PIPELINE_NOTIFY_WORKERS = pipeline_config.get("notify_workers", 2)
+# Processes that parse result pages, 0 parses them in the bot process.
+PARSE_PROCESSES = pipeline_config.get("parse_processes", 0)
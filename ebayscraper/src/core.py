@@ -13,7 +13,7 @@ from telegram.ext import (
     Application,
     CallbackQueryHandler,
 )
-from scrape_async import background_scraper
+from scrape_async import background_scraper, scrape_pipeline
 from utils.telegram_command_utils import (
     start_command,
     init_command,
@@ -29,6 +29,13 @@ from utils.telegram_command_utils import (
     delete_button_handler,
 )
 from utils.postgres_utils import async_pool
+from utils.http_client import http_client
+from utils.location_cache import location_cache
+from utils.item_cache import known_item_cache
+from utils.notification_dispatcher import notification_dispatcher
+from utils.llm_worker import llm_worker
+from utils.parsers import parser_pool
+from utils.extraction_cache import extraction_cache
 from ebayscraper.src.constants import TOKEN
 import asyncio
 
@@ -38,17 +45,30 @@ logger.setLevel(logging.INFO)
 
 
 async def post_init(application: Application):
-    """Open the DB pool after the bot has been initialized."""
+    """Open the DB pool and the HTTP client after the bot has been initialized."""
     await async_pool.open()  # Connects the pool to the database
     logger.info("Database connection pool opened.")
-    asyncio.create_task(background_scraper(application.bot))
+    await known_item_cache.warm()
+    await http_client.open()
+    logger.info("HTTP client opened.")
+    notification_dispatcher.start(application.bot)
+    llm_worker.start()
+    parser_pool.start()
+    asyncio.create_task(background_scraper())
     logger.info("Background scraper task created.")
 
 
 async def post_shutdown(application: Application):
-    """Close the DB pool gracefully when the application stops."""
+    """Close the DB pool and the HTTP client gracefully when the application stops."""
+    await scrape_pipeline.stop()
+    await notification_dispatcher.stop()
+    llm_worker.stop()
+    parser_pool.stop()
+    extraction_cache.save()
     await async_pool.close()
     logger.info("Database connection pool closed.")
+    await location_cache.flush()
+    await http_client.close()
 
 
 # main method of the telegram bot
@@ -1,19 +1,36 @@
 import asyncio
-import telegram
-import aiohttp
+import time
 import urllib.parse
-from bs4 import BeautifulSoup, element
-import datetime
-from utils.utils import parse_price_to_int, get_location_id, replace_umlauts
-from constants import SCRAPE_URL, SCRAPE_INTERVAL
-from classes import SearchRequest, Item
-from utils.telegram_command_utils import send_notification
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from utils.utils import (
+    get_location_id,
+    replace_umlauts,
+    normalize_location,
+)
+from constants import (
+    SCRAPE_URL,
+    SCRAPE_INTERVAL,
+    SCRAPE_CONCURRENCY,
+    PAGINATION_MAX_PAGES,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_PARSE_WORKERS,
+    PIPELINE_PERSIST_WORKERS,
+    PIPELINE_NOTIFY_WORKERS,
+    PARSE_PROCESSES,
+)
+from classes import SearchRequest, FetchKey, Item
+from utils.notification_dispatcher import notification_dispatcher
+from utils.http_client import http_client, HttpResponse
+from utils.rate_limiter import ThrottledError
+from utils.parsers import parser_pool, extract_identifiers, fingerprint_result_page
+from utils.item_cache import known_item_cache, page_history, PageFingerprint
+from utils.scheduler import scrape_scheduler
+from utils.pipeline import Pipeline, Stage
 from utils.postgres_utils import (
     fetch_for_scraping,
-    get_item_via_id_from_db,
-    check_if_notification_already_sent_db,
-    add_item_to_db,
-    add_notification_sent_db,
+    get_unsent_notifications_db,
+    add_items_to_db,
 )
 import logging
 
@@ -23,120 +40,299 @@ logger.setLevel(logging.INFO)
 EBAY_KLEINANZEIGEN_URL = SCRAPE_URL
 
 
+@dataclass(slots=True)
+class ScrapeJob:
+    """A scrape of one result page on its way through the stages of the scrape pipeline."""
+
+    fetch_key: FetchKey
+    subscribers: list[SearchRequest]
+    full_pass: bool
+    pages: list[str] = field(default_factory=list)  # HTML of the fetched result pages
+    items: list[Item] = field(default_factory=list)
+    new_items: int = 0  # Listings that were not in the database before
+    notifications: list[tuple[SearchRequest, Item]] = field(default_factory=list)
+    fingerprint: PageFingerprint | None = None
+
+    @property
+    def search_ids(self) -> frozenset[int]:
+        return frozenset(search_request.search_id for search_request in self.subscribers)
+
+    def __str__(self) -> str:
+        return str(self.fetch_key)
+
+
 async def async_requests(
-    chat_id: int, item: str, location: str, radius: int, bot: telegram.Bot
-) -> BeautifulSoup | None:
-    location = replace_umlauts(location).lower().strip().replace(" ", "-")
-    loc_id = await get_location_id(location)
-    if loc_id is None:
-        logger.info(f"Location {location} not found.")
-        await send_notification(
-            msg=f"Location {location} not found. Please check the location.",
-            chat_id=chat_id,
-            bot=bot,
-        )
-        return None
+    item: str,
+    location: str,
+    loc_id: str,
+    radius: int,
+    page: int = 1,
+    conditional_headers: dict[str, str] | None = None,
+) -> HttpResponse:
     header = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.0.0 Safari/537.36 Edg/106.0.1370.47"
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.0.0 Safari/537.36 Edg/106.0.1370.47",
+        **(conditional_headers or {}),
     }
+    # Further result pages have the page number between the location and the item.
+    page_path = f"seite:{page}/" if page > 1 else ""
     logger.info(
-        f"Scraping data for {item.capitalize()} in {location.capitalize()} with radius {radius} km using the following URL: {EBAY_KLEINANZEIGEN_URL}{location}/{replace_umlauts(item)}/k0{loc_id}r{radius}"
+        f"Scraping data for {item.capitalize()} in {location.capitalize()} with radius {radius} km using the following URL: {EBAY_KLEINANZEIGEN_URL}{location}/{page_path}{replace_umlauts(item)}/k0{loc_id}r{radius}"
+    )
+    response = await http_client.get(
+        f"{EBAY_KLEINANZEIGEN_URL}{urllib.parse.quote(location)}/{page_path}{urllib.parse.quote(item)}/k0{loc_id}r{radius}",
+        headers=header,
     )
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{EBAY_KLEINANZEIGEN_URL}{urllib.parse.quote(location)}/{urllib.parse.quote(item)}/k0{loc_id}r{radius}",
-            headers=header,
-        ) as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
-            return soup
+    return response
 
 
-async def background_scraper(bot: telegram.Bot):
+def group_search_requests(
+    search_requests: list[SearchRequest],
+) -> dict[FetchKey, list[SearchRequest]]:
+    """
+    Collapses the search requests of all users into unique fetch keys.
+    Every key maps to the search requests (subscribers) that are served by the same result page.
+    """
+    grouped_requests: dict[FetchKey, list[SearchRequest]] = {}
+    for search_request in search_requests:
+        fetch_key = FetchKey(
+            item_name=search_request.item_name,
+            location=normalize_location(search_request.location),
+            radius=search_request.radius,
+        )
+        grouped_requests.setdefault(fetch_key, []).append(search_request)
+    return grouped_requests
+
+
+async def background_scraper():
+    """
+    Hands every result page to the scrape pipeline when the scheduler says it is due, instead of scraping
+    all pages at once and sleeping afterwards. If the pipeline is full, due pages wait here.
+    The search requests are read from the database every SCRAPE_INTERVAL.
+    """
+    scrape_pipeline.start()
+    grouped_requests: dict[FetchKey, list[SearchRequest]] = {}
+    refreshed_at: float | None = None
     while True:
-        logger.info("Starting scraping...")
-        results = await fetch_for_scraping()
-        if not results:
-            logger.info("No requests found for scraping.")
-            await asyncio.sleep(SCRAPE_INTERVAL)
-            continue
-        scrape_tasks = []
-        for result in results:
-            task = asyncio.create_task(
-                scrape_data_async(
-                    search_request=SearchRequest.from_db(search_tuple=result),
-                    bot=bot,
+        if refreshed_at is None or time.monotonic() - refreshed_at >= SCRAPE_INTERVAL:
+            if refreshed_at is not None:
+                logger.info(f"HTTP stats: {http_client.stats}")
+                for host, rate_limiter in http_client.rate_limiters.items():
+                    logger.info(f"Rate limiter for {host}: {rate_limiter}")
+                logger.info(f"Known item cache: {known_item_cache}")
+                logger.info(f"Page history: {page_history}")
+                logger.info(f"Notifications: {notification_dispatcher}")
+                logger.info(f"Schedule: {scrape_scheduler}")
+                logger.info(f"Pipeline: {scrape_pipeline}")
+            results = await fetch_for_scraping()
+            grouped_requests = group_search_requests(
+                [SearchRequest.from_db(search_tuple=result) for result in results]
+            )
+            # Spread the pages over the first interval at startup instead of scraping all of them at once.
+            scrape_scheduler.sync(set(grouped_requests), spread=refreshed_at is None)
+            page_history.retain(set(grouped_requests))
+            refreshed_at = time.monotonic()
+            if results:
+                logger.info(
+                    f"{len(grouped_requests)} unique result pages for {len(results)} search requests."
+                )
+            else:
+                logger.info("No requests found for scraping.")
+        for fetch_key in scrape_scheduler.pop_due():
+            subscribers = grouped_requests[fetch_key]
+            search_ids = frozenset(search_request.search_id for search_request in subscribers)
+            await scrape_pipeline.submit(
+                ScrapeJob(
+                    fetch_key=fetch_key,
+                    subscribers=subscribers,
+                    full_pass=page_history.needs_full_pass(fetch_key, search_ids),
                 )
             )
-            scrape_tasks.append(task)
-        await asyncio.gather(*scrape_tasks)
-        await asyncio.sleep(SCRAPE_INTERVAL)
-
-
-# Add else case
-async def scrape_data_async(search_request: SearchRequest, bot: telegram.Bot):
-    soup = await async_requests(
-        chat_id=search_request.chat_id,
-        item=search_request.item_name,
-        location=search_request.location,
-        radius=search_request.radius,
-        bot=bot,
-    )
-    if soup is None:
-        logger.info(f"Scraping failed for {search_request.item_name} in {search_request.location}.")
-        return
-    for entry in soup.find_all("article", {"class": "aditem"}):
-        db_item_id = None
-        item_from_ebay = find_item_information(entry=entry)
-        existing_item = await get_item_via_id_from_db(identifier=item_from_ebay.identifier)
-        if not existing_item:
-            db_item_id = await add_item_to_db(item_from_ebay)
-            logger.info(
-                f"Item {item_from_ebay.item_name} added to the database with ID {db_item_id}."
+        # A scrape that finishes meanwhile can move its page before the computed wake up time.
+        scrape_scheduler.rescheduled.clear()
+        sleep_time = refreshed_at + SCRAPE_INTERVAL - time.monotonic()
+        next_due = scrape_scheduler.time_until_next_due()
+        if next_due is not None:
+            sleep_time = min(sleep_time, next_due)
+        try:
+            await asyncio.wait_for(scrape_scheduler.rescheduled.wait(), max(sleep_time, 0))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def fetch_stage(job: ScrapeJob) -> ScrapeJob | None:
+    """Resolves the location and fetches the result pages of the job."""
+    fetch_key = job.fetch_key
+    loc_id = await get_location_id(fetch_key.location)
+    if loc_id is None:
+        logger.info(f"Location {fetch_key.location} not found.")
+        for search_request in job.subscribers:
+            await notification_dispatcher.enqueue(
+                msg=f"Location {fetch_key.location} not found. Please check the location.",
+                chat_id=search_request.chat_id,
             )
-        else:
-            db_item_id = existing_item.item_id
-            logger.debug(
-                f"Item {item_from_ebay.item_name} already exists in the database with ID {db_item_id}."
+        return None
+    # A full pass always processes the page, even if it did not change.
+    previous_fingerprint = None if job.full_pass else page_history.fingerprint(fetch_key)
+    for page in range(1, PAGINATION_MAX_PAGES + 1):
+        try:
+            response = await async_requests(
+                item=fetch_key.item_name,
+                location=fetch_key.location,
+                loc_id=loc_id,
+                radius=fetch_key.radius,
+                page=page,
+                conditional_headers=(
+                    previous_fingerprint.conditional_headers()
+                    if page == 1 and previous_fingerprint is not None
+                    else None
+                ),
             )
-
-        if item_from_ebay.price > search_request.price_limit:
-            logger.debug(
-                f"Item {item_from_ebay.item_name} exceeds price limit of {search_request.price_limit}€."
+        except ThrottledError as e:
+            logger.warning(f"Stopped scraping {fetch_key} at page {page}: {e}")
+            break
+        page_history.pages_fetched += 1
+        if page > 1:
+            page_history.extra_pages_fetched += 1
+        if response.status == 304:
+            logger.debug(f"{fetch_key} is not modified.")
+            page_history.record_unchanged(fetch_key)
+            return None
+        if response.status != 200:
+            logger.error(f"Error scraping {fetch_key} at page {page}: status {response.status}")
+            break
+        html = response.text
+        if page == 1:
+            job.fingerprint = PageFingerprint(
+                digest=fingerprint_result_page(html),
+                etag=response.header("ETag"),
+                last_modified=response.header("Last-Modified"),
             )
-            continue
-
-        if await check_if_notification_already_sent_db(
-            search_id=search_request.search_id, item_id=db_item_id
+            if (
+                previous_fingerprint is not None
+                and previous_fingerprint.digest == job.fingerprint.digest
+            ):
+                logger.debug(f"{fetch_key} has the same listings as in the last scrape.")
+                page_history.record_unchanged(fetch_key, job.fingerprint)
+                return None
+        job.pages.append(html)
+        if page == PAGINATION_MAX_PAGES or page_history.ends_in_known(
+            fetch_key, extract_identifiers(html)
         ):
+            break
+    if len(job.pages) > 1:
+        logger.info(f"Fetched {len(job.pages)} result pages for {fetch_key}.")
+    return job if job.pages else None
+
+
+async def parse_stage(job: ScrapeJob) -> ScrapeJob:
+    """Extracts the listings of the fetched pages, only the new ones unless it is a full pass."""
+    known_identifiers = None if job.full_pass else page_history.known_identifiers(job.fetch_key)
+    job.items, skipped = await parser_pool.parse(
+        job.pages, known_identifiers, known_streak=page_history.known_streak
+    )
+    page_history.skipped_listings += skipped
+    job.pages.clear()  # The HTML is not needed anymore, free it while the job waits in the next queues.
+    return job
+
+
+async def persist_stage(job: ScrapeJob) -> ScrapeJob:
+    """
+    Stores new listings and matches every listing against the price limit of each subscribed
+    search request. Keeps the matches that were not notified yet.
+    """
+    item_ids = known_item_cache.get_many([item.identifier for item in job.items])
+    new_items = [item for item in job.items if item.identifier not in item_ids]
+    if new_items:
+        new_item_ids = await add_items_to_db(new_items)
+        known_item_cache.add_many(new_item_ids)
+        item_ids.update(new_item_ids)
+    job.new_items = len(new_items)
+    candidates = []
+    for item_from_ebay in job.items:
+        item_from_ebay.item_id = item_ids[item_from_ebay.identifier]
+        for search_request in job.subscribers:
+            if item_from_ebay.price > search_request.price_limit:
+                logger.debug(
+                    f"Item {item_from_ebay.item_name} exceeds price limit of {search_request.price_limit}€."
+                )
+                continue
+            candidates.append((search_request, item_from_ebay))
+
+    unsent_notifications = await get_unsent_notifications_db(
+        [(search_request.search_id, item.item_id) for search_request, item in candidates]
+    )
+    for search_request, item_from_ebay in candidates:
+        notification = (search_request.search_id, item_from_ebay.item_id)
+        if notification in notification_dispatcher.pending:
+            continue  # Queued by an earlier scrape, it is recorded once it was sent.
+        if notification not in unsent_notifications:
             logger.debug(
-                f"Notification for item {item_from_ebay.item_name} with ID {db_item_id} already sent."
+                f"Notification for item {item_from_ebay.item_name} with ID {item_from_ebay.item_id} already sent."
             )
             continue
+        # The same listing can appear twice on a page.
+        unsent_notifications.discard(notification)
+        job.notifications.append((search_request, item_from_ebay))
+    return job
+
 
-        logger.info(f"Message sent to chat_id: {search_request.chat_id}")
+async def notify_stage(job: ScrapeJob) -> None:
+    """
+    Queues the notifications of the job and records the processed listings.
+    The dispatcher records the notifications in the database once they were sent.
+    """
+    for search_request, item_from_ebay in job.notifications:
+        logger.info(f"Notification queued for chat_id: {search_request.chat_id}")
         msg = f"""✨ New Offer Found for {search_request.item_name}! ✨
 💰 Price: {item_from_ebay.price}€
 🔗 Link: {item_from_ebay.url}"""
-        await send_notification(msg=msg, chat_id=search_request.chat_id, bot=bot)
-        await add_notification_sent_db(search_id=search_request.search_id, item_id=db_item_id)
-
-
-# Extract the information for items of a given soup tag and returns an instance of ItemFromEbay that contains all the data
-def find_item_information(entry: element.PageElement) -> Item:
-    split_string = str(entry["data-href"][11:]).split("/")
-    item_name = split_string[0]
-    identifier = split_string[1]
-    url = f"{EBAY_KLEINANZEIGEN_URL[: len(EBAY_KLEINANZEIGEN_URL) - 2]}{entry['data-href'][1:]}"
-    price_html = entry.find("p", {"class": "aditem-main--middle--price-shipping--price"})
-    if price_html is not None:
-        price = parse_price_to_int(str(price_html.text.strip()))
-    else:
-        price = 0
-    return Item(
-        item_name=item_name,
-        identifier=identifier,
-        url=url,
-        price=price,
-        last_seen_date=datetime.datetime.now(),
+        await notification_dispatcher.enqueue(
+            msg=msg,
+            chat_id=search_request.chat_id,
+            key=(search_request.search_id, item_from_ebay.item_id),
+        )
+    page_history.update(
+        job.fetch_key,
+        job.search_ids,
+        job.items,
+        full_pass=job.full_pass,
+        fingerprint=job.fingerprint,
     )
+    return None
+
+
+def reschedule(job: ScrapeJob) -> None:
+    """Called when a job leaves the pipeline, the number of new listings drives the schedule of the page."""
+    scrape_scheduler.record(job.fetch_key, new_items=job.new_items)
+
+
+def create_scrape_pipeline(on_finished: Callable[[ScrapeJob], None]) -> Pipeline:
+    """Chains the scrape stages, 'on_finished' is called when a job leaves the pipeline."""
+    return Pipeline(
+        stages=[
+            Stage("fetch", fetch_stage, workers=SCRAPE_CONCURRENCY, queue_size=PIPELINE_QUEUE_SIZE),
+            # Enough workers to keep every parser process busy.
+            Stage(
+                "parse",
+                parse_stage,
+                workers=max(PIPELINE_PARSE_WORKERS, PARSE_PROCESSES),
+                queue_size=PIPELINE_QUEUE_SIZE,
+            ),
+            Stage(
+                "persist",
+                persist_stage,
+                workers=PIPELINE_PERSIST_WORKERS,
+                queue_size=PIPELINE_QUEUE_SIZE,
+            ),
+            Stage(
+                "notify",
+                notify_stage,
+                workers=PIPELINE_NOTIFY_WORKERS,
+                queue_size=PIPELINE_QUEUE_SIZE,
+            ),
+        ],
+        on_finished=on_finished,
+    )
+
+
+scrape_pipeline = create_scrape_pipeline(on_finished=reschedule)
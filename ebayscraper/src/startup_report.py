@@ -0,0 +1,75 @@
+"""
+Reports how long importing the bot takes, broken down per module.
+Run it from the same directory as the bot, e.g. `python ebayscraper/src/startup_report.py --top 25`.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+
+
+@dataclass(slots=True)
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def measure_import_times(module: str) -> list[ImportTime]:
+    """Imports 'module' in a fresh interpreter with '-X importtime' and parses its report."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(SRC_DIR), str(SRC_DIR.parent.parent), env.get("PYTHONPATH", "")]
+    )
+    completed_process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed_process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed_process.stderr}")
+    import_times = []
+    for line in completed_process.stderr.splitlines():
+        # Lines look like: "import time:       412 |       1093 |   encodings"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, imported_module = line.removeprefix("import time:").split("|")
+        import_times.append(
+            ImportTime(
+                module=imported_module.strip(),
+                self_us=int(self_us),
+                cumulative_us=int(cumulative_us),
+            )
+        )
+    return import_times
+
+
+def print_report(import_times: list[ImportTime], top: int) -> None:
+    total_us = sum(import_time.self_us for import_time in import_times)
+    print(f"Total import time: {total_us / 1000:.1f} ms for {len(import_times)} modules\n")
+
+    print(f"Top {top} modules by cumulative time (including their own imports):")
+    for import_time in sorted(import_times, key=lambda x: x.cumulative_us, reverse=True)[:top]:
+        print(f"{import_time.cumulative_us / 1000:>10.1f} ms  {import_time.module}")
+
+    print(f"\nTop {top} packages by own time (all submodules summed up):")
+    package_times: dict[str, int] = {}
+    for import_time in import_times:
+        package = import_time.module.split(".")[0]
+        package_times[package] = package_times.get(package, 0) + import_time.self_us
+    for package, self_us in sorted(package_times.items(), key=lambda x: x[1], reverse=True)[:top]:
+        print(f"{self_us / 1000:>10.1f} ms  {package}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="core", help="Module to import, defaults to the bot.")
+    parser.add_argument("--top", type=int, default=20, help="Number of entries per table.")
+    args = parser.parse_args()
+    print_report(measure_import_times(args.module), top=args.top)
@@ -0,0 +1,84 @@
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from ebayscraper.src.classes import SearchRequest
+from ebayscraper.src.constants import EXTRACTION_CACHE_SIZE, EXTRACTION_CACHE_PATH
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class ExtractionCache:
+    """
+    Bounded LRU cache of normalized messages -> extracted search values, so identical messages
+    of different users or retries only run through the LLM once.
+    Only successful extractions are cached. With a 'path' the cache survives restarts.
+    """
+
+    def __init__(self, max_size: int, path: str | None) -> None:
+        self._max_size = max_size
+        self._path = Path(path) if path is not None else None
+        self._entries: OrderedDict[str, tuple[str, int, str, int]] | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_entries(self) -> OrderedDict[str, tuple[str, int, str, int]]:
+        if self._entries is None:
+            self._entries = OrderedDict()
+            if self._path is not None and self._path.exists():
+                with open(self._path, "r") as file:
+                    for key, values in json.load(file):
+                        self._entries[key] = tuple(values)
+                logger.info(f"Loaded {len(self._entries)} extraction results from {self._path}.")
+        return self._entries
+
+    def get(self, chat_id: int, key: str) -> SearchRequest | None:
+        entries = self._get_entries()
+        values = entries.get(key)
+        if values is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entries.move_to_end(key)
+        item_name, price_limit, location, radius = values
+        return SearchRequest(
+            chat_id=chat_id,
+            item_name=item_name,
+            price_limit=price_limit,
+            location=location,
+            radius=radius,
+        )
+
+    def add(self, key: str, search_request: SearchRequest) -> None:
+        entries = self._get_entries()
+        entries[key] = (
+            search_request.item_name,
+            search_request.price_limit,
+            search_request.location,
+            search_request.radius,
+        )
+        entries.move_to_end(key)
+        while len(entries) > self._max_size:
+            entries.popitem(last=False)
+
+    def save(self) -> None:
+        if self._path is None or self._entries is None:
+            return
+        temporary_path = self._path.with_name(f"{self._path.name}.tmp")
+        try:
+            with open(temporary_path, "w") as file:
+                json.dump(list(self._entries.items()), file, ensure_ascii=False)
+            os.replace(temporary_path, self._path)
+            logger.info(f"Saved {len(self._entries)} extraction results to {self._path}.")
+        except OSError as e:
+            logger.error(f"Error saving extraction results to {self._path}: {e}")
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self._get_entries())} cached extractions, {self.hits} hits, {self.misses} misses"
+        )
+
+
+extraction_cache = ExtractionCache(max_size=EXTRACTION_CACHE_SIZE, path=EXTRACTION_CACHE_PATH)
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import re
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+import aiohttp
+from ebayscraper.src.constants import (
+    HTTP_TOTAL_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_CONNECTION_LIMIT,
+    HTTP_CONNECTION_LIMIT_PER_HOST,
+    HTTP_RATE,
+    HTTP_BURST,
+    HTTP_BACKOFF,
+    HTTP_MAX_BACKOFF,
+    HTTP_CIRCUIT_BREAKER_THRESHOLD,
+    HTTP_MODE,
+    HTTP_ARCHIVE_PATH,
+    HTTP_REPLAY_SPEED,
+)
+from utils.rate_limiter import HostRateLimiter, ThrottledError
+from utils.traffic_archive import RecordedResponse, TrafficRecorder, TrafficReplayer
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+THROTTLING_STATUS_CODES = {403, 429}
+# Pages that are delivered with status 200, but ask for a captcha instead of showing results.
+CAPTCHA_PATTERN = re.compile(
+    r"captcha-delivery\.com|<title>[^<]*(?:captcha|sicherheitsabfrage|access denied)", re.IGNORECASE
+)
+
+
+@dataclass(slots=True)
+class HttpResponse:
+    url: str
+    status: int
+    text: str
+    headers: dict[str, str]
+    elapsed: float  # Seconds from sending the request until the body was read
+    connect_time: float = 0.0  # Seconds spent opening a new connection, 0 if one was reused
+
+    def json(self) -> dict:
+        return json.loads(self.text)
+
+    def header(self, name: str) -> str | None:
+        """Looks up a response header case-insensitively."""
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return None
+
+
+@dataclass(slots=True)
+class HttpStats:
+    requests: int = 0
+    failed_requests: int = 0
+    throttled_requests: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+    dns_lookups: int = 0
+    dns_cache_hits: int = 0
+    request_time: float = 0.0
+    connect_time: float = 0.0
+    status_codes: dict[int, int] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        average_request_time = self.request_time / self.requests if self.requests else 0.0
+        return (
+            f"{self.requests} requests ({self.failed_requests} failed, {self.throttled_requests} throttled), "
+            f"avg {average_request_time * 1000:.1f} ms, "
+            f"{self.new_connections} new / {self.reused_connections} reused connections, "
+            f"{self.connect_time * 1000:.1f} ms spent connecting, "
+            f"{self.dns_lookups} DNS lookups / {self.dns_cache_hits} DNS cache hits, "
+            f"status codes: {self.status_codes}"
+        )
+
+
+class HttpClient:
+    """
+    Application wide HTTP client that keeps one aiohttp session (and thus its connection pool
+    and DNS cache) alive for the whole lifetime of the bot.
+    It is opened and closed in the same way as the database pool.
+    Requests are paced per host. Throttled responses raise ThrottledError instead of being returned,
+    so error and captcha pages never reach the parsers.
+    In "record" mode every response is appended to a traffic archive, in "replay" mode the responses
+    come from the archive instead of the network, with the same pacing and throttling as live requests.
+    """
+
+    def __init__(self) -> None:
+        self._session: aiohttp.ClientSession | None = None
+        self.stats = HttpStats()
+        self.rate_limiters: dict[str, HostRateLimiter] = {}
+        if HTTP_MODE not in ("live", "record", "replay"):
+            raise ValueError(f"Unknown HTTP mode '{HTTP_MODE}'. Use 'live', 'record' or 'replay'.")
+        self.recorder = TrafficRecorder(HTTP_ARCHIVE_PATH) if HTTP_MODE == "record" else None
+        self.replayer = (
+            TrafficReplayer(HTTP_ARCHIVE_PATH, speed=HTTP_REPLAY_SPEED)
+            if HTTP_MODE == "replay"
+            else None
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def open(self) -> None:
+        if self.is_open:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._create_trace_config()],
+        )
+        if self.recorder is not None:
+            self.recorder.open()
+        if self.replayer is not None:
+            self.replayer.load()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.replayer is not None:
+            logger.info(f"Traffic replay: {self.replayer}")
+        logger.info(f"HTTP client closed. Stats: {self.stats}")
+
+    async def get(self, url: str, headers: dict[str, str] | None = None) -> HttpResponse:
+        """
+        Sends a GET request over the shared session and returns the fully read response.
+        Raises ThrottledError if the host throttles us or its circuit breaker is open.
+        """
+        if self._session is None:
+            raise RuntimeError("The HTTP client is not open. Call 'open' first.")
+        rate_limiter = self._get_rate_limiter(url)
+        await rate_limiter.acquire()
+        timings: dict[str, float] = {"connect_time": 0.0}
+        start = time.perf_counter()
+        self.stats.requests += 1
+        try:
+            if self.replayer is not None:
+                status, response_headers, text = await self._replay(url)
+            else:
+                async with self._session.get(
+                    url, headers=headers, trace_request_ctx=timings
+                ) as response:
+                    text = await response.text()
+                status, response_headers = response.status, dict(response.headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.stats.failed_requests += 1
+            rate_limiter.record_failure()
+            raise
+        except asyncio.CancelledError:
+            rate_limiter.cancel_probe()
+            raise
+        elapsed = time.perf_counter() - start
+        self.stats.request_time += elapsed
+        self.stats.status_codes[status] = self.stats.status_codes.get(status, 0) + 1
+        logger.debug(
+            f"GET {url} returned {status} in {elapsed * 1000:.1f} ms "
+            f"(connect: {timings['connect_time'] * 1000:.1f} ms)"
+        )
+        http_response = HttpResponse(
+            url=url,
+            status=status,
+            text=text,
+            headers=response_headers,
+            elapsed=elapsed,
+            connect_time=timings["connect_time"],
+        )
+        if self.recorder is not None:
+            # Throttled responses are recorded as well, so a replay runs into the same throttling.
+            self.recorder.record(
+                RecordedResponse(
+                    url=url,
+                    recorded_at=time.time(),
+                    status=status,
+                    headers=response_headers,
+                    text=text,
+                    elapsed=elapsed,
+                )
+            )
+        if (
+            status in THROTTLING_STATUS_CODES
+            or status >= 500
+            or CAPTCHA_PATTERN.search(text) is not None
+        ):
+            self.stats.throttled_requests += 1
+            rate_limiter.record_failure(
+                retry_after=self._parse_retry_after(http_response.header("Retry-After"))
+            )
+            raise ThrottledError(f"GET {url} was throttled with status {status}.")
+        rate_limiter.record_success()
+        return http_response
+
+    async def _replay(self, url: str) -> tuple[int, dict[str, str], str]:
+        recorded_response = await self.replayer.get(url)
+        if recorded_response is None:
+            return 404, {}, ""  # Like a page that does not exist, the archive has no answer for it.
+        return recorded_response.status, recorded_response.headers, recorded_response.text
+
+    def _get_rate_limiter(self, url: str) -> HostRateLimiter:
+        host = urllib.parse.urlsplit(url).hostname or ""
+        rate_limiter = self.rate_limiters.get(host)
+        if rate_limiter is None:
+            rate_limiter = HostRateLimiter(
+                rate=HTTP_RATE,
+                burst=HTTP_BURST,
+                backoff=HTTP_BACKOFF,
+                max_backoff=HTTP_MAX_BACKOFF,
+                failure_threshold=HTTP_CIRCUIT_BREAKER_THRESHOLD,
+            )
+            self.rate_limiters[host] = rate_limiter
+        return rate_limiter
+
+    @staticmethod
+    def _parse_retry_after(retry_after: str | None) -> float | None:
+        # Retry-After can also be an HTTP date, which is left to the backoff.
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return None
+
+    def _create_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_start(
+            session: aiohttp.ClientSession, context: SimpleNamespace, params: object
+        ) -> None:
+            context.connect_start = time.perf_counter()
+
+        async def on_connection_create_end(
+            session: aiohttp.ClientSession, context: SimpleNamespace, params: object
+        ) -> None:
+            connect_time = time.perf_counter() - context.connect_start
+            self.stats.new_connections += 1
+            self.stats.connect_time += connect_time
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx["connect_time"] = connect_time
+
+        async def on_connection_reuseconn(
+            session: aiohttp.ClientSession, context: SimpleNamespace, params: object
+        ) -> None:
+            self.stats.reused_connections += 1
+
+        async def on_dns_resolvehost_end(
+            session: aiohttp.ClientSession, context: SimpleNamespace, params: object
+        ) -> None:
+            self.stats.dns_lookups += 1
+
+        async def on_dns_cache_hit(
+            session: aiohttp.ClientSession, context: SimpleNamespace, params: object
+        ) -> None:
+            self.stats.dns_cache_hits += 1
+
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        return trace_config
+
+
+http_client = HttpClient()
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from ebayscraper.src.classes import FetchKey, Item
+from ebayscraper.src.constants import (
+    KNOWN_ITEM_CACHE_SIZE,
+    INCREMENTAL_KNOWN_STREAK,
+    INCREMENTAL_FULL_PASS_EVERY,
+)
+from utils.postgres_utils import get_recent_item_ids_db
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class KnownItemCache:
+    """
+    Bounded LRU index of ebay_identifier -> item_id for listings that are already stored in the database.
+    Scrape cycles only go to the database for listings that are not in this index.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._item_ids: OrderedDict[str, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._item_ids)
+
+    def get_many(self, identifiers: list[str]) -> dict[str, int]:
+        """Returns the item_ids of all identifiers that are known."""
+        known_item_ids = {}
+        for identifier in identifiers:
+            item_id = self._item_ids.get(identifier)
+            if item_id is None:
+                self.misses += 1
+                continue
+            self.hits += 1
+            self._item_ids.move_to_end(identifier)
+            known_item_ids[identifier] = item_id
+        return known_item_ids
+
+    def add_many(self, item_ids: dict[str, int]) -> None:
+        for identifier, item_id in item_ids.items():
+            self._item_ids[identifier] = item_id
+            self._item_ids.move_to_end(identifier)
+        while len(self._item_ids) > self._max_size:
+            self._item_ids.popitem(last=False)
+
+    async def warm(self) -> None:
+        """Loads the most recently seen items from the database."""
+        recent_item_ids = await get_recent_item_ids_db(limit=self._max_size)
+        # The query returns the newest items first, they have to be inserted last to be evicted last.
+        self.add_many(dict(reversed(recent_item_ids)))
+        logger.info(f"Known item cache warmed with {len(self)} items.")
+
+    def __str__(self) -> str:
+        return f"{len(self)} known items, {self.hits} hits, {self.misses} misses"
+
+
+known_item_cache = KnownItemCache(max_size=KNOWN_ITEM_CACHE_SIZE)
+
+
+@dataclass(slots=True)
+class PageFingerprint:
+    digest: str  # See parsers.fingerprint_result_page
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+@dataclass(slots=True)
+class PageState:
+    identifiers: set[str]
+    search_ids: frozenset[int]
+    incremental_passes: int = 0
+    fingerprint: PageFingerprint | None = None  # Of the first result page
+
+
+class PageHistory:
+    """
+    Remembers which listings were already processed for each result page and for which search requests.
+    Result pages are ordered newest first, so a scrape only processes listings until it meets
+    'known_streak' processed listings in a row. Pinned listings at the top of the page are shorter than the streak.
+    Every 'full_pass_every'th scrape, the first scrape of a page and every scrape after
+    its search requests changed process the whole page.
+    """
+
+    def __init__(self, known_streak: int, full_pass_every: int) -> None:
+        self.known_streak = known_streak
+        self._full_pass_every = full_pass_every
+        self._pages: dict[FetchKey, PageState] = {}
+        self.full_passes = 0
+        self.incremental_passes = 0
+        self.skipped_listings = 0
+        self.unchanged_pages = 0
+        self.pages_fetched = 0
+        self.extra_pages_fetched = 0  # Pages after the first one, see PAGINATION_MAX_PAGES
+
+    def needs_full_pass(self, fetch_key: FetchKey, search_ids: frozenset[int]) -> bool:
+        page_state = self._pages.get(fetch_key)
+        return (
+            self.known_streak <= 0
+            or page_state is None
+            or page_state.search_ids != search_ids
+            or page_state.incremental_passes + 1 >= self._full_pass_every
+        )
+
+    def fingerprint(self, fetch_key: FetchKey) -> PageFingerprint | None:
+        page_state = self._pages.get(fetch_key)
+        return page_state.fingerprint if page_state is not None else None
+
+    def record_unchanged(
+        self, fetch_key: FetchKey, fingerprint: PageFingerprint | None = None
+    ) -> None:
+        """
+        Counts a scrape whose first page did not change as an incremental pass without any work.
+        A new 'fingerprint' keeps the validators of the response for the next conditional request.
+        """
+        self.unchanged_pages += 1
+        self.incremental_passes += 1
+        page_state = self._pages.get(fetch_key)
+        if page_state is None:
+            return  # 'retain' dropped the page while it was scraped.
+        page_state.incremental_passes += 1
+        if fingerprint is not None:
+            page_state.fingerprint = fingerprint
+
+    def known_identifiers(self, fetch_key: FetchKey) -> frozenset[str] | None:
+        """
+        The listings of a page that were already processed, as an immutable copy for the parsers.
+        None if the page is not known (anymore), the parsers then process the whole page.
+        """
+        page_state = self._pages.get(fetch_key)
+        return frozenset(page_state.identifiers) if page_state is not None else None
+
+    def ends_in_known(self, fetch_key: FetchKey, identifiers: list[str]) -> bool:
+        """
+        Whether the listings of a result page end in processed listings, so the following pages only contain
+        processed listings as well. Processed listings pinned at the top of the page do not count.
+        Without any processed listings it is True as well, the first scrape of a search only looks at the first page.
+        """
+        page_state = self._pages.get(fetch_key)
+        if page_state is None:
+            return True
+        known_in_a_row = 0
+        for identifier in identifiers:
+            if identifier not in page_state.identifiers:
+                known_in_a_row = 0
+                continue
+            known_in_a_row += 1
+            if known_in_a_row >= max(self.known_streak, 1):
+                return True
+        return known_in_a_row > 0
+
+    def update(
+        self,
+        fetch_key: FetchKey,
+        search_ids: frozenset[int],
+        items: list[Item],
+        full_pass: bool,
+        fingerprint: PageFingerprint | None,
+    ) -> None:
+        """Records the processed listings of a scrape once all of their notifications are queued."""
+        if full_pass:
+            self.full_passes += 1
+            # A full pass replaces the listings, so identifiers that left the page are forgotten.
+            self._pages[fetch_key] = PageState(
+                identifiers={item.identifier for item in items},
+                search_ids=search_ids,
+                fingerprint=fingerprint,
+            )
+            return
+        self.incremental_passes += 1
+        page_state = self._pages.get(fetch_key)
+        if page_state is None:
+            return  # 'retain' dropped the page while it was scraped, its searches are gone.
+        page_state.identifiers.update(item.identifier for item in items)
+        page_state.incremental_passes += 1
+        page_state.fingerprint = fingerprint
+
+    def retain(self, fetch_keys: set[FetchKey]) -> None:
+        """Forgets the result pages that have no search requests anymore."""
+        for fetch_key in self._pages.keys() - fetch_keys:
+            del self._pages[fetch_key]
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self._pages)} pages, {self.full_passes} full / {self.incremental_passes} incremental passes, "
+            f"{self.skipped_listings} listings skipped, {self.unchanged_pages} unchanged pages skipped, "
+            f"{self.pages_fetched} pages fetched ({self.extra_pages_fetched} after the first page)"
+        )
+
+
+page_history = PageHistory(
+    known_streak=INCREMENTAL_KNOWN_STREAK, full_pass_every=INCREMENTAL_FULL_PASS_EVERY
+)
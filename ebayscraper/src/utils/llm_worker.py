@@ -0,0 +1,190 @@
+import asyncio
+import dataclasses
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from ebayscraper.src.classes import SearchRequest
+from ebayscraper.src.constants import (
+    LLM_ENABLED,
+    LLM_PRELOAD,
+    LLM_MODEL_PATH,
+    LLM_N_CTX,
+    LLM_PREFIX_STATE_PATH,
+    LLM_QUEUE_SIZE,
+    LLM_TIMEOUT,
+    LLM_WORKERS,
+    LLM_THREADS,
+)
+from ebayscraper.src.utils.machine_learning import (
+    load_model,
+    is_model_loaded,
+    extract_message_with_ml,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@dataclasses.dataclass(slots=True)
+class ExtractionRequest:
+    chat_id: int
+    chat_message: str
+    result: asyncio.Future
+
+
+class LLMWorker:
+    """
+    Hosts the language model in separate processes, so a completion never blocks the event loop.
+    Every message is extracted as its own task in the process pool, so each caller gets its result
+    as soon as its message is done. Up to 'workers' messages are extracted in parallel, each process
+    with its own copy of the model. A message that is already being extracted is not extracted
+    again, its callers share the result.
+    At most 'queue_size' requests are accepted at the same time, further requests are rejected
+    right away instead of piling up behind a slow model.
+    The model is loaded on the first request or, with 'preload', in the background after startup.
+    With 'enabled' set to False no process is started and only the schema format is understood.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        preload: bool,
+        model_path: str,
+        n_ctx: int,
+        prefix_state_path: str | None,
+        queue_size: int,
+        timeout: float,
+        workers: int,
+        n_threads: int | None,
+    ) -> None:
+        self.enabled = enabled
+        self._preload = preload
+        self._model_path = model_path
+        self._n_ctx = n_ctx
+        self._prefix_state_path = prefix_state_path
+        self._queue_size = queue_size
+        self._timeout = timeout
+        self._workers = workers
+        self._n_threads = n_threads
+        self._executor: ProcessPoolExecutor | None = None
+        self._started = False
+        self._extraction_tasks: set[asyncio.Task] = set()
+        # The requests of every message that waits for or is in the process pool, by message.
+        self._running: dict[str, list[ExtractionRequest]] = {}
+        self._pending = 0
+        self.extractions = 0
+        self.shared_requests = 0
+
+    def start(self) -> None:
+        if not self.enabled or self._started:
+            return
+        self._started = True
+        executor = self._get_executor()
+        if self._preload:
+            # Every task spawns a process, whose initializer loads the model.
+            # The bot already answers schema messages meanwhile.
+            for _ in range(self._workers):
+                executor.submit(is_model_loaded)
+
+    def stop(self) -> None:
+        self._started = False
+        for requests in self._running.values():
+            for request in requests:
+                self._finish(request, None)
+        self._running.clear()
+        self._shutdown_executor()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # llama.cpp starts its own threads, so the workers are spawned instead of forked.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=load_model,
+                initargs=(self._model_path, self._n_ctx, self._prefix_state_path, self._n_threads),
+            )
+            logger.info(f"LLM worker pool with {self._workers} processes started.")
+        return self._executor
+
+    def _shutdown_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("LLM worker pool stopped.")
+
+    async def extract(self, chat_id: int, chat_message: str) -> SearchRequest | None:
+        if not self.enabled:
+            logger.info(f"LLM is disabled, cannot extract search values for chat_id: {chat_id}")
+            return None
+        if self._pending >= self._queue_size:
+            logger.error(f"LLM queue is full, rejecting message from chat_id: {chat_id}")
+            return None
+        self.start()
+        request = ExtractionRequest(
+            chat_id=chat_id,
+            chat_message=chat_message,
+            result=asyncio.get_running_loop().create_future(),
+        )
+        self._pending += 1
+        try:
+            running_requests = self._running.get(chat_message)
+            if running_requests is not None:
+                running_requests.append(request)
+                self.shared_requests += 1
+            else:
+                self._running[chat_message] = [request]
+                # The pool queues the messages while all of its processes are busy.
+                task = asyncio.create_task(self._run_extraction(chat_message))
+                self._extraction_tasks.add(task)
+                task.add_done_callback(self._extraction_tasks.discard)
+            # The future is shielded, a timed out caller must not break a result others share.
+            return await asyncio.wait_for(asyncio.shield(request.result), timeout=self._timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"LLM request from chat_id: {chat_id} timed out after {self._timeout} s.")
+            return None
+        finally:
+            self._pending -= 1
+
+    async def _run_extraction(self, chat_message: str) -> None:
+        search_values = None
+        try:
+            self.extractions += 1
+            logger.info(f"Running LLM extraction, {len(self._running)} messages in progress.")
+            search_values = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), extract_message_with_ml, chat_message
+            )
+        except BrokenProcessPool:
+            logger.error("LLM worker process died, the pool will be restarted on the next request.")
+            self._shutdown_executor()
+        except Exception as e:
+            logger.error(f"Error running LLM extraction: {e}")
+        finally:
+            for request in self._running.pop(chat_message, []):
+                self._finish(request, search_values)
+
+    @staticmethod
+    def _finish(request: ExtractionRequest, search_values: SearchRequest | None) -> None:
+        if search_values is not None:
+            search_values = dataclasses.replace(search_values, chat_id=request.chat_id)
+        if not request.result.done():
+            request.result.set_result(search_values)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.extractions} extractions, "
+            f"{self.shared_requests} requests shared the extraction of an identical message"
+        )
+
+
+llm_worker = LLMWorker(
+    enabled=LLM_ENABLED,
+    preload=LLM_PRELOAD,
+    model_path=LLM_MODEL_PATH,
+    n_ctx=LLM_N_CTX,
+    prefix_state_path=LLM_PREFIX_STATE_PATH,
+    queue_size=LLM_QUEUE_SIZE,
+    timeout=LLM_TIMEOUT,
+    workers=LLM_WORKERS,
+    n_threads=LLM_THREADS,
+)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+import urllib.parse
+from pathlib import Path
+import aiofiles
+import aiofiles.os
+from ebayscraper.src.constants import LOCATION_NOT_FOUND_TTL
+from utils.http_client import http_client
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+LOCATION_SUGGESTION_URL = "https://www.kleinanzeigen.de/s-ort-empfehlungen.json?query="
+
+
+class LocationCache:
+    """
+    Keeps the mapping of location names to kleinanzeigen.de location IDs in memory.
+    The JSON file is only read on first use and written back in the background after a miss.
+    Concurrent misses for the same location share one request, and locations that
+    kleinanzeigen.de does not know are remembered for 'not_found_ttl' seconds.
+    """
+
+    def __init__(self, path: str, not_found_ttl: float) -> None:
+        self._path = Path(path)
+        self._not_found_ttl = not_found_ttl
+        self._location_ids: dict[str, str] | None = None
+        self._not_found: dict[str, float] = {}  # location -> time when the entry expires
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._persist_task: asyncio.Task | None = None
+        self._dirty = False
+
+    def _get_location_ids(self) -> dict[str, str]:
+        if self._location_ids is None:
+            if self._path.exists():
+                with open(self._path, "r") as file:
+                    self._location_ids = json.load(file)
+            else:
+                self._location_ids = {}
+            logger.info(f"Loaded {len(self._location_ids)} location IDs from {self._path}.")
+        return self._location_ids
+
+    def known_locations(self) -> set[str]:
+        return set(self._get_location_ids())
+
+    async def get(self, location: str) -> str | None:
+        location_ids = self._get_location_ids()
+        if location in location_ids:
+            logger.debug(f"Cache hit for '{location}'")
+            return location_ids[location]
+        expires_at = self._not_found.get(location)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                logger.debug(f"Negative cache hit for '{location}'")
+                return None
+            del self._not_found[location]
+        lookup = self._in_flight.get(location)
+        if lookup is None:
+            lookup = asyncio.create_task(self._lookup(location))
+            self._in_flight[location] = lookup
+            lookup.add_done_callback(lambda _: self._in_flight.pop(location, None))
+        # Shield the shared lookup, so a cancelled caller does not cancel it for the others.
+        return await asyncio.shield(lookup)
+
+    async def _lookup(self, location: str) -> str | None:
+        url = f"{LOCATION_SUGGESTION_URL}{urllib.parse.quote_plus(location)}"
+        response = await http_client.get(url)
+        if response.status != 200:
+            logger.error(f"Error fetching location ID for '{location}': {response.status}")
+            return None
+        keys = list(response.json().keys())
+        if len(keys) < 2:
+            logger.info(f"Location '{location}' not found.")
+            self._not_found[location] = time.monotonic() + self._not_found_ttl
+            return None
+        location_id = str(keys[1]).replace(
+            "_", "l"
+        )  # Get the second key from the dictionary which corresponds to the location. The first is germany.
+        # The locations is returned as _299424, so we need to replace the _ with l.
+        self._get_location_ids()[location] = location_id
+        logger.info(f"Cache updated for '{location}' with ID '{location_id}'")
+        self._schedule_persist()
+        return location_id
+
+    def _schedule_persist(self) -> None:
+        self._dirty = True
+        if self._persist_task is None or self._persist_task.done():
+            self._persist_task = asyncio.create_task(self._persist())
+
+    async def _persist(self) -> None:
+        # Misses that happen while a write is running are collected into the next write.
+        while self._dirty:
+            self._dirty = False
+            content_to_write = json.dumps(self._get_location_ids(), indent=4, ensure_ascii=False)
+            temporary_path = self._path.with_name(f"{self._path.name}.tmp")
+            try:
+                async with aiofiles.open(temporary_path, "w") as file:
+                    await file.write(content_to_write)
+                await aiofiles.os.replace(temporary_path, self._path)
+            except OSError as e:
+                logger.error(f"Error writing location IDs to {self._path}: {e}")
+
+    async def flush(self) -> None:
+        """Waits until all pending updates are written to disk."""
+        if self._persist_task is not None:
+            await self._persist_task
+
+
+location_cache = LocationCache(path="./location_ids.json", not_found_ttl=LOCATION_NOT_FOUND_TTL)
@@ -1,8 +1,17 @@
-from llama_cpp import Llama
+from __future__ import annotations
+import hashlib
 import json
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
 from ebayscraper.src.classes import SearchRequest
 import logging
 
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -98,27 +107,108 @@ MESSAGES = [
     },
 ]
 
-llm = Llama(
-    model_path="./gemma-2-9b-it-q5_0.gguf",
-    n_gpu_layers=-1,  # Use all available GPU memory
-    verbose=False,
-    n_ctx=2048,
-    temperature=0.1,  # Lower temperature for more deterministic output
-)
+llm: Llama | None = None
+
+
+def load_model(
+    model_path: str = "./gemma-2-9b-it-q5_0.gguf",
+    n_ctx: int = 2048,
+    prefix_state_path: str | None = None,
+    n_threads: int | None = None,
+) -> Llama:
+    """
+    Loads the model into this process on first use.
+    llama_cpp is only imported here, so importing this module stays cheap.
+    With 'prefix_state_path' the evaluated few-shot prompt is loaded from or saved to that file.
+    """
+    global llm
+    if llm is None:
+        from llama_cpp import Llama
+
+        logger.info(f"Loading model {model_path}")
+        start = time.perf_counter()
+        llm = Llama(
+            model_path=model_path,
+            n_gpu_layers=-1,  # Use all available GPU memory
+            verbose=False,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            temperature=0.1,  # Lower temperature for more deterministic output
+        )
+        logger.info(f"Loaded model {model_path} in {time.perf_counter() - start:.1f} s")
+        if prefix_state_path is not None:
+            load_prefix_state(prefix_state_path)
+    return llm
+
+
+def get_prefix_state_key(model: Llama) -> str:
+    """The saved state is only valid for the same prompt, model file and context size."""
+    model_stat = os.stat(model.model_path)
+    key_content = json.dumps(
+        [MESSAGES, model.model_path, model_stat.st_size, model_stat.st_mtime, model.n_ctx()]
+    )
+    return hashlib.sha256(key_content.encode()).hexdigest()
+
+
+def load_prefix_state(path: str) -> None:
+    """
+    Restores the evaluated few-shot prompt from 'path' or evaluates it once and saves it there.
+    llama.cpp reuses the longest common prefix of the evaluated tokens and the next prompt, so in a
+    running process only the new user message is processed anyway. The saved state makes the first
+    request after a restart just as fast.
+    """
+    model = load_model()
+    key = get_prefix_state_key(model)
+    state_path = Path(path)
+    if state_path.exists():
+        try:
+            with open(state_path, "rb") as file:
+                saved_key, saved_state = pickle.load(file)
+            if saved_key == key:
+                model.load_state(saved_state)
+                logger.info(f"Loaded prompt prefix state from {state_path}")
+                return
+            logger.info(f"Prompt prefix state in {state_path} is outdated.")
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.error(f"Error loading prompt prefix state from {state_path}: {e}")
+
+    start = time.perf_counter()
+    model.reset()
+    # The message of the user differs per request, but everything before it is evaluated here.
+    model.create_chat_completion(
+        messages=[*MESSAGES, {"role": "user", "content": ""}],
+        max_tokens=1,
+    )
+    prefix_state = model.save_state()
+    logger.info(f"Evaluated prompt prefix in {time.perf_counter() - start:.1f} s")
+    temporary_path = state_path.with_name(f"{state_path.name}.tmp")
+    try:
+        with open(temporary_path, "wb") as file:
+            pickle.dump((key, prefix_state), file)
+        os.replace(temporary_path, state_path)
+    except OSError as e:
+        logger.error(f"Error saving prompt prefix state to {state_path}: {e}")
+
+
+def is_model_loaded() -> bool:
+    return llm is not None
 
 
 def extract_search_values_with_ml(chat_id: int, chat_message: str) -> SearchRequest | None:
     """
     Extracts the JSON content from the assistant's response.
     """
-    MESSAGES.append(
+    # The few-shot prompt is shared, so the user message is only added to a copy of it.
+    messages = [
+        *MESSAGES,
         {
             "role": "user",
             "content": chat_message,
-        }
-    )
-    response = llm.create_chat_completion(
-        messages=MESSAGES,
+        },
+    ]
+    model = load_model()
+    response = model.create_chat_completion(
+        messages=messages,
         max_tokens=1024,
         stop=["+++"],  # Stop generation when '+++' is encountered
     )
@@ -142,10 +232,8 @@ def extract_search_values_with_ml(chat_id: int, chat_message: str) -> SearchRequ
         logger.error(
             f"Response content that led to an error: {response['choices'][0]['message']['content']}"
         )
-        MESSAGES.pop()  # Remove the last user message in case of error
         return None
 
-    MESSAGES.pop()  # Remove the last user message
     return SearchRequest(
         chat_id=chat_id,
         item_name=response_as_json["name"].lower().strip(),
@@ -153,3 +241,16 @@ def extract_search_values_with_ml(chat_id: int, chat_message: str) -> SearchRequ
         location=response_as_json["stadt"].lower().strip(),
         radius=response_as_json["radius"],
     )
+
+
+def extract_message_with_ml(chat_message: str) -> SearchRequest | None:
+    """
+    Extracts the search values of a message in the worker process.
+    The result belongs to chat_id 0 and is assigned to the requesting chats by the caller.
+    """
+    try:
+        return extract_search_values_with_ml(chat_id=0, chat_message=chat_message)
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        # An answer with missing or malformed fields is not worth a crashed worker process.
+        logger.error(f"Unexpected answer of the model for message '{chat_message}': {e}")
+        return None
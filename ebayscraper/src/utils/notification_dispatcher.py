@@ -0,0 +1,207 @@
+import asyncio
+import datetime
+import time
+from dataclasses import dataclass
+import telegram
+from telegram.error import Forbidden, BadRequest, RetryAfter, NetworkError
+from ebayscraper.src.constants import (
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_PER_CHAT_RATE,
+    TELEGRAM_WORKERS,
+    TELEGRAM_QUEUE_SIZE,
+    TELEGRAM_MAX_ATTEMPTS,
+)
+from utils.rate_limiter import TokenBucket
+from utils.telegram_command_utils import send_notification
+from utils.postgres_utils import add_notifications_sent_db
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MAX_IDLE_CHAT_BUCKETS = 1_000
+RECORD_SENT_INTERVAL = 1.0  # Seconds between the writes of the sent notifications to the database
+
+
+@dataclass(slots=True)
+class Notification:
+    chat_id: int
+    msg: str
+    attempts: int = 0
+    key: tuple[int, int] | None = None  # (search_id, item_id) of a notification about a listing
+
+
+class NotificationDispatcher:
+    """
+    Sends notifications from a bounded queue with a fixed number of workers.
+    The global and per-chat flood limits of the Bot API are enforced with token buckets
+    and a RetryAfter answer pauses all workers for the requested time.
+    The scraper only enqueues and never waits for Telegram.
+    Notifications about listings are recorded in the database once they were sent. Until then their
+    (search_id, item_id) is in 'pending', so the next scrape does not queue them again. One that
+    could not be sent is dropped from 'pending' and queued again by the next full pass of its page,
+    scrapes in between skip the listing because it is in the page history already.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        per_chat_rate: float,
+        workers: int,
+        queue_size: int,
+        max_attempts: int,
+    ) -> None:
+        self._per_chat_rate = per_chat_rate
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._queue: asyncio.Queue[Notification] = asyncio.Queue(maxsize=queue_size)
+        self._worker_tasks: list[asyncio.Task] = []
+        self._paused_until = 0.0
+        self._bot: telegram.Bot | None = None
+        self._unrecorded: list[tuple[int, int]] = []  # Sent, but not in the database yet
+        self._record_task: asyncio.Task | None = None
+        self.pending: set[tuple[int, int]] = set()
+        self.sent = 0
+        self.failed = 0
+
+    def start(self, bot: telegram.Bot) -> None:
+        self._bot = bot
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+        self._record_task = asyncio.create_task(self._record_sent_periodically())
+        logger.info(f"Notification dispatcher started with {self._workers} workers.")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Gives the queued notifications 'timeout' seconds to be sent and stops the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._queue.qsize()} notifications were not sent before shutdown.")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if self._record_task is not None:
+            self._record_task.cancel()
+            await asyncio.gather(self._record_task, return_exceptions=True)
+            self._record_task = None
+        await self._record_sent()
+        # Notifications that are still queued were not sent, the next start scrapes them again.
+        self.pending.clear()
+        logger.info(f"Notification dispatcher stopped. {self}")
+
+    async def enqueue(self, chat_id: int, msg: str, key: tuple[int, int] | None = None) -> None:
+        """
+        Queues a notification. Only waits if the queue is full.
+        With a (search_id, item_id) 'key' it is recorded in the database once it was sent.
+        """
+        if key is not None:
+            self.pending.add(key)
+        try:
+            await self._queue.put(Notification(chat_id=chat_id, msg=msg, key=key))
+        except asyncio.CancelledError:
+            if key is not None:
+                self.pending.discard(key)
+            raise
+
+    def __str__(self) -> str:
+        return (
+            f"{self.sent} sent, {self.failed} failed, {self._queue.qsize()} queued, "
+            f"{len(self.pending)} pending"
+        )
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self._chat_buckets:
+            if len(self._chat_buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                # Full buckets belong to chats that did not get a message recently.
+                self._chat_buckets = {
+                    bucket_chat_id: bucket
+                    for bucket_chat_id, bucket in self._chat_buckets.items()
+                    if not bucket.is_full
+                }
+            self._chat_buckets[chat_id] = TokenBucket(rate=self._per_chat_rate, capacity=1)
+        return self._chat_buckets[chat_id]
+
+    async def _worker(self) -> None:
+        while True:
+            notification = await self._queue.get()
+            sent = False
+            try:
+                sent = await self._deliver(notification)
+            except Exception as e:
+                self.failed += 1
+                logger.error(
+                    f"Unexpected error sending notification to {notification.chat_id}: {e}"
+                )
+            finally:
+                if notification.key is not None:
+                    if sent:
+                        self._unrecorded.append(notification.key)
+                    else:
+                        self.pending.discard(notification.key)
+                self._queue.task_done()
+
+    async def _record_sent_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(RECORD_SENT_INTERVAL)
+            await self._record_sent()
+
+    async def _record_sent(self) -> None:
+        """Writes the sent notifications to the database in one statement."""
+        if not self._unrecorded:
+            return
+        sent_notifications, self._unrecorded = self._unrecorded, []
+        try:
+            await add_notifications_sent_db(sent_notifications)
+        except Exception as e:
+            logger.error(f"Error recording {len(sent_notifications)} sent notifications: {e}")
+            self._unrecorded.extend(sent_notifications)  # Tried again with the next write
+            return
+        self.pending.difference_update(sent_notifications)
+
+    async def _deliver(self, notification: Notification) -> bool:
+        """Returns whether the notification was sent."""
+        while True:
+            notification.attempts += 1
+            await self._get_chat_bucket(notification.chat_id).acquire()
+            await self._global_bucket.acquire()
+            if (pause := self._paused_until - time.monotonic()) > 0:
+                await asyncio.sleep(pause)
+            try:
+                await send_notification(
+                    chat_id=notification.chat_id, msg=notification.msg, bot=self._bot
+                )
+                self.sent += 1
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"Flood limit reached, pausing notifications for {retry_after} s.")
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                # A RetryAfter does not count as failed attempt, the message was not processed.
+                notification.attempts -= 1
+            except (Forbidden, BadRequest) as e:
+                # The user blocked the bot or the chat is gone, retrying right away will not help.
+                self.failed += 1
+                logger.info(f"Notification to {notification.chat_id} rejected: {e}")
+                return False
+            except NetworkError as e:
+                if notification.attempts >= self._max_attempts:
+                    self.failed += 1
+                    logger.error(
+                        f"Giving up on notification to {notification.chat_id} after "
+                        f"{notification.attempts} attempts: {e}"
+                    )
+                    return False
+                await asyncio.sleep(2**notification.attempts)
+
+
+notification_dispatcher = NotificationDispatcher(
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    per_chat_rate=TELEGRAM_PER_CHAT_RATE,
+    workers=TELEGRAM_WORKERS,
+    queue_size=TELEGRAM_QUEUE_SIZE,
+    max_attempts=TELEGRAM_MAX_ATTEMPTS,
+)
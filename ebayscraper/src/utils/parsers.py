@@ -0,0 +1,284 @@
+import asyncio
+import datetime
+import hashlib
+import multiprocessing
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer, element
+from ebayscraper.src.classes import Item
+from ebayscraper.src.constants import SCRAPE_URL, HTML_PARSER, PARSE_PROCESSES
+from utils.utils import parse_price_to_int
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PRICE_CLASS = "aditem-main--middle--price-shipping--price"
+DATA_HREF_PATTERN = re.compile(r'data-href="(/s-anzeige/[^"]+)"')
+# The listing links and their prices in page order, everything a notification depends on.
+FINGERPRINT_PATTERN = re.compile(
+    rf'data-href="(/s-anzeige/[^"]+)"|class="{PRICE_CLASS}"[^>]*>([^<]*)'
+)
+
+
+def build_item(data_href: str, price_text: str | None) -> Item:
+    """
+    Creates an Item from the 'data-href' attribute of an 'article.aditem' element and the text of its price node.
+    """
+    split_string = str(data_href[11:]).split("/")
+    item_name = split_string[0]
+    identifier = split_string[1]
+    url = f"{SCRAPE_URL[: len(SCRAPE_URL) - 2]}{data_href[1:]}"
+    if price_text is not None:
+        price = parse_price_to_int(price_text.strip())
+    else:
+        price = 0
+    return Item(
+        item_name=item_name,
+        identifier=identifier,
+        url=url,
+        price=price,
+        last_seen_date=datetime.datetime.now(),
+    )
+
+
+# Extract the information for items of a given soup tag and returns an instance of ItemFromEbay that contains all the data
+def find_item_information(entry: element.PageElement) -> Item:
+    price_html = entry.find("p", {"class": PRICE_CLASS})
+    return build_item(
+        data_href=entry["data-href"],
+        price_text=str(price_html.text) if price_html is not None else None,
+    )
+
+
+def extract_result_list(html: str) -> str:
+    """
+    Cuts the part of the page that contains the listings, so the parsers do not have to build
+    a tree for the header, the filters and the footer.
+    """
+    start = html.find("<article")
+    end = html.rfind("</article>")
+    if start == -1 or end == -1:
+        return ""
+    return html[start : end + len("</article>")]
+
+
+def extract_identifiers(html: str) -> list[str]:
+    """
+    Returns the identifiers of the listings of a result page in order, without building a tree.
+    Cheap enough to decide whether the next result page is needed before the page is parsed.
+    """
+    return [
+        data_href[11:].split("/")[1]
+        for data_href in DATA_HREF_PATTERN.findall(extract_result_list(html))
+    ]
+
+
+def fingerprint_result_page(html: str) -> str:
+    """
+    Hashes the listings and prices of a result page, ignoring the parts of the page that change
+    on every request. An unchanged fingerprint means there is nothing new on the page.
+    """
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for data_href, price_text in FINGERPRINT_PATTERN.findall(extract_result_list(html)):
+        fingerprint.update(f"{data_href}|{' '.join(price_text.split())}\n".encode())
+    return fingerprint.hexdigest()
+
+
+class ResultPageParser(ABC):
+    name: str
+
+    @abstractmethod
+    def iter_items(self, html: str) -> Iterator[Item]:
+        """
+        Yields the listings of a result page in the order they appear on the page.
+        Listings are only built when they are consumed, so callers can stop early.
+        """
+
+    def parse(self, html: str) -> list[Item]:
+        """Returns the listings of a result page in the order they appear on the page."""
+        return list(self.iter_items(html))
+
+
+class BeautifulSoupParser(ResultPageParser):
+    """Pure Python fallback that only needs BeautifulSoup and the builtin 'html.parser'."""
+
+    name = "html.parser"
+
+    def __init__(self) -> None:
+        self._strainer = SoupStrainer("article")
+
+    def iter_items(self, html: str) -> Iterator[Item]:
+        soup = BeautifulSoup(extract_result_list(html), "html.parser", parse_only=self._strainer)
+        for entry in soup.find_all("article", {"class": "aditem"}):
+            if entry.has_attr("data-href"):
+                yield find_item_information(entry=entry)
+
+
+class LxmlParser(ResultPageParser):
+    name = "lxml"
+
+    def __init__(self) -> None:
+        import lxml.html  # Optional dependency, raises ImportError if it is not installed.
+
+        self._lxml_html = lxml.html
+
+    def iter_items(self, html: str) -> Iterator[Item]:
+        result_list = extract_result_list(html)
+        if not result_list:
+            return
+        root = self._lxml_html.fragment_fromstring(result_list, create_parent="div")
+        for entry in root.xpath(
+            ".//article[contains(concat(' ', normalize-space(@class), ' '), ' aditem ')]"
+        ):
+            data_href = entry.get("data-href")
+            if data_href is None:
+                continue
+            price_nodes = entry.xpath(
+                f".//p[contains(concat(' ', normalize-space(@class), ' '), ' {PRICE_CLASS} ')]"
+            )
+            yield build_item(
+                data_href=data_href,
+                price_text=price_nodes[0].text_content() if price_nodes else None,
+            )
+
+
+class SelectolaxParser(ResultPageParser):
+    name = "selectolax"
+
+    def __init__(self) -> None:
+        from selectolax.lexbor import LexborHTMLParser  # Optional dependency.
+
+        self._html_parser = LexborHTMLParser
+
+    def iter_items(self, html: str) -> Iterator[Item]:
+        result_list = extract_result_list(html)
+        if not result_list:
+            return
+        tree = self._html_parser(result_list)
+        for entry in tree.css("article.aditem"):
+            data_href = entry.attributes.get("data-href")
+            if data_href is None:
+                continue
+            price_node = entry.css_first(f"p.{PRICE_CLASS}")
+            yield build_item(
+                data_href=data_href,
+                price_text=price_node.text() if price_node is not None else None,
+            )
+
+
+PARSER_BACKENDS: dict[str, type[ResultPageParser]] = {
+    SelectolaxParser.name: SelectolaxParser,
+    LxmlParser.name: LxmlParser,
+    BeautifulSoupParser.name: BeautifulSoupParser,
+}
+
+
+def create_result_page_parser(name: str) -> ResultPageParser:
+    """
+    Creates the parser backend with the given name.
+    With 'auto' the fastest installed backend is used, falling back to 'html.parser'.
+    """
+    if name != "auto":
+        if name not in PARSER_BACKENDS:
+            raise ValueError(f"Unknown HTML parser '{name}'. Use one of {list(PARSER_BACKENDS)}.")
+        return PARSER_BACKENDS[name]()
+    for backend in PARSER_BACKENDS.values():
+        try:
+            parser = backend()
+        except ImportError:
+            logger.debug(f"HTML parser '{backend.name}' is not installed.")
+            continue
+        logger.info(f"Using HTML parser '{parser.name}'.")
+        return parser
+    raise RuntimeError("No HTML parser available.")  # Unreachable, html.parser is always available.
+
+
+result_page_parser = create_result_page_parser(HTML_PARSER)
+
+
+def take_until_known(
+    items: Iterable[Item], known_identifiers: set[str] | frozenset[str], known_streak: int
+) -> tuple[list[Item], int]:
+    """
+    Returns the listings that are not in 'known_identifiers', up to the first 'known_streak' known listings
+    in a row, and the number of known listings that were skipped. The remaining listings are not consumed at all.
+    """
+    new_items = []
+    skipped = 0
+    known_in_a_row = 0
+    for item in items:
+        if item.identifier not in known_identifiers:
+            new_items.append(item)
+            known_in_a_row = 0
+            continue
+        skipped += 1
+        known_in_a_row += 1
+        if known_in_a_row >= known_streak:
+            break  # The rest of the page was processed by earlier scrapes.
+    return new_items, skipped
+
+
+def parse_result_pages(
+    pages: list[str], known_identifiers: frozenset[str] | None, known_streak: int
+) -> tuple[list[Item], int]:
+    """
+    Parses the result pages of one search in order and drops listings that show up on two pages.
+    Without 'known_identifiers' every listing is returned, otherwise see take_until_known.
+    Runs in the parser processes as well, so arguments and results have to be picklable.
+    """
+    items: list[Item] = []
+    identifiers: set[str] = set()
+    skipped = 0
+    for html in pages:
+        if known_identifiers is None:
+            page_items = result_page_parser.parse(html)
+        else:
+            page_items, page_skipped = take_until_known(
+                result_page_parser.iter_items(html), known_identifiers, known_streak
+            )
+            skipped += page_skipped
+        # Listings move to the next page while we fetch, so they can show up twice.
+        items.extend(item for item in page_items if item.identifier not in identifiers)
+        identifiers.update(item.identifier for item in page_items)
+    return items, skipped
+
+
+class ParserPool:
+    """
+    Parses result pages in 'processes' worker processes, so parsing is not limited to the core of the event loop.
+    With 0 processes the pages are parsed in the bot process, which is enough for small deployments.
+    """
+
+    def __init__(self, processes: int) -> None:
+        self._processes = processes
+        self._executor: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self._processes <= 0 or self._executor is not None:
+            return
+        # Spawned like the LLM worker, every process imports the parsers once and keeps them.
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._processes, mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Parser pool with {self._processes} processes started.")
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Parser pool stopped.")
+
+    async def parse(
+        self, pages: list[str], known_identifiers: frozenset[str] | None, known_streak: int
+    ) -> tuple[list[Item], int]:
+        if self._executor is None:
+            return parse_result_pages(pages, known_identifiers, known_streak)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, parse_result_pages, pages, known_identifiers, known_streak
+        )
+
+
+parser_pool = ParserPool(processes=PARSE_PROCESSES)
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class Stage:
+    """
+    One step of a Pipeline: 'workers' tasks take jobs from a queue of at most 'queue_size' jobs
+    and pass them to 'handler'. The handler returns the job for the next stage, or None if the job is finished.
+    A full queue blocks the previous stage, so a slow stage slows down the stages in front of it
+    instead of letting pending jobs pile up.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any | None]],
+        workers: int,
+        queue_size: int,
+    ) -> None:
+        self.name = name
+        self._handler = handler
+        self._workers = workers
+        self._queue_size = queue_size
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+        self.busy_workers = 0
+        self.blocked_workers = 0  # Workers that wait for room in the queue of the next stage
+        self.busy_time = 0.0  # Seconds spent in the handler, summed up over all workers
+        self._started_at = 0.0
+
+    async def put(self, job: Any) -> None:
+        await self._queue.put(job)
+
+    def start(
+        self, forward: Callable[[Any], Awaitable[None]] | None, finish: Callable[[Any], None]
+    ) -> None:
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._started_at = time.monotonic()
+        self._tasks = [
+            asyncio.create_task(self._work(forward, finish), name=f"{self.name}-{index}")
+            for index in range(self._workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(
+        self, forward: Callable[[Any], Awaitable[None]] | None, finish: Callable[[Any], None]
+    ) -> None:
+        while True:
+            job = await self._queue.get()
+            self.busy_workers += 1
+            start = time.perf_counter()
+            try:
+                next_job = await self._handler(job)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error in pipeline stage '{self.name}' for {job}: {e}")
+                next_job = None
+            finally:
+                self.busy_time += time.perf_counter() - start
+                self.busy_workers -= 1
+                self._queue.task_done()
+            self.processed += 1
+            if next_job is None or forward is None:
+                finish(job)
+            else:
+                self.blocked_workers += 1
+                try:
+                    await forward(next_job)
+                finally:
+                    self.blocked_workers -= 1
+
+    def __str__(self) -> str:
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        average_time = self.busy_time / self.processed if self.processed else 0.0
+        queue_depth = self._queue.qsize() if self._queue is not None else 0
+        return (
+            f"{self.name}: queue {queue_depth}/{self._queue_size}, "
+            f"{self.busy_workers}/{self._workers} busy, {self.blocked_workers} blocked, {self.processed} done ({self.failed} failed), "
+            f"{self.processed / elapsed:.2f} jobs/s, avg {average_time * 1000:.1f} ms"
+        )
+
+
+class Pipeline:
+    """
+    Chains stages that are joined by bounded queues. Every job runs through the stages in order
+    until a stage finishes it, then 'on_finished' is called with the job.
+    Every stage has its own concurrency, so the stats show which stage is the bottleneck:
+    its workers are busy all the time and the queue in front of it is full.
+    """
+
+    def __init__(self, stages: list[Stage], on_finished: Callable[[Any], None]) -> None:
+        self._stages = stages
+        self._on_finished = on_finished
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self) -> None:
+        if self._running:
+            return
+        for index, stage in enumerate(self._stages):
+            # The last stage finishes every job it gets.
+            forward = self._stages[index + 1].put if index + 1 < len(self._stages) else None
+            stage.start(forward=forward, finish=self._on_finished)
+        self._running = True
+        logger.info(f"Pipeline with stages {[stage.name for stage in self._stages]} started.")
+
+    async def stop(self) -> None:
+        for stage in self._stages:
+            await stage.stop()
+        self._running = False
+
+    async def submit(self, job: Any) -> None:
+        """Waits until the first stage has room for the job."""
+        await self._stages[0].put(job)
+
+    def __str__(self) -> str:
+        return " | ".join(str(stage) for stage in self._stages)
@@ -118,6 +118,43 @@ async def add_notification_sent_db(search_id: int, item_id: int):
         )
 
 
+async def add_notifications_sent_db(notifications: list[tuple[int, int]]) -> None:
+    """
+    Adds the notification sent records for many (search_id, item_id) pairs in a single statement.
+    Records that already exist and pairs of searches that were removed in the meantime are ignored.
+    """
+    if not notifications:
+        return
+    query_template = sql.SQL(
+        """INSERT INTO {table} ({fields})
+              SELECT sent.search_id, sent.item_id
+              FROM unnest(%s::int[], %s::int[]) AS sent(search_id, item_id)
+              JOIN {searches_table} ON {searches_table}.search_id = sent.search_id
+              ON CONFLICT ({conflict_fields}) DO NOTHING;"""
+    )
+    table_name = sql.Identifier(Tables.NOTIFICATIONS)
+    columns = [
+        sql.Identifier("search_id"),
+        sql.Identifier("item_id"),
+    ]
+    fields_sql = sql.SQL(",").join(columns)
+    finished_query = query_template.format(
+        table=table_name,
+        fields=fields_sql,
+        searches_table=sql.Identifier(Tables.SEARCHES),
+        conflict_fields=fields_sql,
+    )
+
+    async with get_db_cursor(commit=True) as acur:
+        await acur.execute(
+            finished_query,
+            (
+                [search_id for search_id, _ in notifications],
+                [item_id for _, item_id in notifications],
+            ),
+        )
+
+
 async def add_search_request_db(chat_id: int, search_request: SearchRequest) -> int:
     """
     Adds a search request to the database.
@@ -217,6 +254,64 @@ async def add_item_to_db(item: Item) -> int:
         return (await acur.fetchone())[0]  # type: ignore # Will never be None, as we use RETURNING item_id. We have to await first thus the parantheses here.
 
 
+async def add_items_to_db(items: list[Item]) -> dict[str, int]:
+    """
+    Adds all items of a result page to the database in a single statement.
+    Existing items are updated in the same way as in add_item_to_db.
+    Returns a mapping of the ebay_identifier to the item_id of every item.
+    """
+    # A row must not be affected twice by one INSERT ... ON CONFLICT, so duplicates are dropped first.
+    unique_items = list({item.identifier: item for item in items}.values())
+    if not unique_items:
+        return {}
+    query_template = sql.SQL(
+        """
+        INSERT INTO {table} ({fields})
+        SELECT * FROM unnest(
+            %s::varchar[], %s::varchar[], %s::int[], %s::varchar[], %s::timestamp[]
+        )
+        ON CONFLICT ({conflict_fields}) DO UPDATE SET
+            price = EXCLUDED.price,
+            last_seen_date = EXCLUDED.last_seen_date,
+            item_name = EXCLUDED.item_name,
+            url = EXCLUDED.url
+        RETURNING ebay_identifier, item_id, (xmax = 0) AS inserted;
+    """
+    )
+    table_name = sql.Identifier(Tables.ITEMS)
+    columns = [
+        sql.Identifier("ebay_identifier"),
+        sql.Identifier("item_name"),
+        sql.Identifier("price"),
+        sql.Identifier("url"),
+        sql.Identifier("last_seen_date"),
+    ]
+    fields_sql = sql.SQL(",").join(columns)
+    conflict_fields = sql.Identifier("ebay_identifier")
+    composed_query = query_template.format(
+        table=table_name,
+        fields=fields_sql,
+        conflict_fields=conflict_fields,
+    )
+
+    async with get_db_cursor(commit=True) as acur:
+        await acur.execute(
+            composed_query,
+            (
+                [item.identifier for item in unique_items],
+                [item.item_name for item in unique_items],
+                [item.price for item in unique_items],
+                [item.url for item in unique_items],
+                [item.last_seen_date for item in unique_items],
+            ),
+        )
+        res_of_sql_exc = await acur.fetchall()
+    new_items = sum(1 for res_tuple in res_of_sql_exc if res_tuple[2])
+    if new_items:
+        logger.info(f"{new_items} of {len(unique_items)} items added to the database.")
+    return {res_tuple[0]: res_tuple[1] for res_tuple in res_of_sql_exc}
+
+
 async def remove_item_from_search_db(chat_id: int, item_name: str) -> None:
     """
     Removes a search request from the database based on chat_id and item_name.
@@ -323,6 +418,28 @@ async def get_item_via_id_from_db(identifier: str) -> Item | None:
         return Item.from_db(res_of_sql_exc)
 
 
+async def get_recent_item_ids_db(limit: int) -> list[tuple[str, int]]:
+    """
+    Retrieves the ebay_identifier and item_id of the most recently seen items.
+    Used to warm the in-memory cache of known items.
+    """
+    query_template = sql.SQL(
+        """
+        SELECT ebay_identifier, item_id
+        FROM {table}
+        ORDER BY last_seen_date DESC NULLS LAST
+        LIMIT %s;
+    """
+    )
+    table_identifier = sql.Identifier(Tables.ITEMS)
+    composed_query = query_template.format(table=table_identifier)
+
+    async with get_db_cursor() as acur:
+        await acur.execute(composed_query, (limit,))
+        res_of_sql_exc = await acur.fetchall()
+    return [(res_tuple[0], res_tuple[1]) for res_tuple in res_of_sql_exc]
+
+
 async def check_if_notification_already_sent_db(search_id: int, item_id: int) -> bool:
     """
     Checks if a notification for a specific search_id and item_id has already been sent.
@@ -344,6 +461,40 @@ async def check_if_notification_already_sent_db(search_id: int, item_id: int) ->
     return bool(res_of_sql_exc)
 
 
+async def get_unsent_notifications_db(
+    candidates: list[tuple[int, int]],
+) -> set[tuple[int, int]]:
+    """
+    Checks many (search_id, item_id) pairs at once, which can belong to one or many searches.
+    Returns the subset of pairs for which no notification has been sent yet.
+    """
+    if not candidates:
+        return set()
+    query_template = sql.SQL(
+        """
+        SELECT candidates.search_id, candidates.item_id
+        FROM unnest(%s::int[], %s::int[]) AS candidates(search_id, item_id)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table} AS sent
+            WHERE sent.search_id = candidates.search_id AND sent.item_id = candidates.item_id
+        );
+    """
+    )
+    table_identifier = sql.Identifier(Tables.NOTIFICATIONS)
+    composed_query = query_template.format(table=table_identifier)
+
+    async with get_db_cursor() as acur:
+        await acur.execute(
+            composed_query,
+            (
+                [search_id for search_id, _ in candidates],
+                [item_id for _, item_id in candidates],
+            ),
+        )
+        res_of_sql_exc = await acur.fetchall()
+    return {(res_tuple[0], res_tuple[1]) for res_tuple in res_of_sql_exc}
+
+
 async def get_all_search_requests_by_user_from_db(chat_id: int) -> list[SearchRequest]:
     """
     Retrieves all search requests for a specific user based on chat_id
@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket that allows 'rate' acquisitions per second on average and bursts of up to 'capacity'.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self._tokens >= self._capacity
+
+    def try_acquire(self) -> float:
+        """
+        Takes a token if one is available and returns 0.
+        Otherwise returns the seconds until the next token is available.
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self._rate
+
+    async def acquire(self) -> None:
+        while (wait_time := self.try_acquire()) > 0:
+            await asyncio.sleep(wait_time)
+
+
+class ThrottledError(Exception):
+    """Raised when a host throttles or blocks us, or while its circuit breaker is open."""
+
+
+class HostRateLimiter:
+    """
+    Paces the requests to one host with a token bucket of 'rate' requests per second and bursts of 'burst'.
+    Every throttled response (429, 403, 5xx or a captcha page) or failed connection pauses all requests
+    to the host for an exponentially growing, jittered backoff that starts at 'backoff' seconds.
+    After 'failure_threshold' failures in a row the circuit breaker opens: requests fail
+    right away for 'max_backoff' seconds, then a single probe request decides whether it closes again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        backoff: float,
+        max_backoff: float,
+        failure_threshold: int,
+    ) -> None:
+        self._bucket = TokenBucket(rate=rate, capacity=burst)
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._failure_threshold = failure_threshold
+        self._failures = 0
+        self._paused_until = 0.0
+        self._probe_running = False
+        self.failed_requests = 0
+
+    @property
+    def state(self) -> str:
+        if self._failures < self._failure_threshold:
+            return self.CLOSED
+        if time.monotonic() < self._paused_until or self._probe_running:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    async def acquire(self) -> None:
+        """Waits until a request may be sent. Raises ThrottledError while the circuit is open."""
+        state = self.state
+        if state == self.OPEN:
+            raise ThrottledError(
+                f"Circuit breaker is open for another {max(self._paused_until - time.monotonic(), 0):.0f} s."
+            )
+        if state == self.HALF_OPEN:
+            self._probe_running = True
+            return
+        while (pause := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+        await self._bucket.acquire()
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probe_running = False
+
+    def cancel_probe(self) -> None:
+        """Lets the next request probe the host if the probe request was cancelled."""
+        self._probe_running = False
+
+    def record_failure(self, retry_after: float | None = None) -> None:
+        """Pauses the host after a throttled or failed request, 'retry_after' is taken from the response if set."""
+        self.failed_requests += 1
+        self._failures += 1
+        self._probe_running = False
+        if self._failures >= self._failure_threshold:
+            pause = self._max_backoff
+        else:
+            pause = min(self._backoff * 2 ** (self._failures - 1), self._max_backoff)
+            # Jitter, so the scrapes waiting for the pause do not all return at the same moment.
+            pause *= random.uniform(0.5, 1.0)
+        if retry_after is not None:
+            pause = max(pause, retry_after)
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def __str__(self) -> str:
+        return f"{self.state}, {self._failures} failures in a row, {self.failed_requests} failed requests"
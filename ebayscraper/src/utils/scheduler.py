@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from ebayscraper.src.classes import FetchKey
+from ebayscraper.src.constants import (
+    SCRAPE_INTERVAL,
+    SCRAPE_MIN_INTERVAL,
+    SCRAPE_MAX_INTERVAL,
+    SCRAPE_JITTER,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SPEEDUP_FACTOR = 0.5  # Applied to the interval after a scrape that found new listings
+BACKOFF_FACTOR = 1.5  # Applied to the interval after a scrape without new listings
+
+
+@dataclass(slots=True)
+class ScheduleEntry:
+    interval: float
+    due: float
+    scrapes: int = 0
+    new_items: int = 0
+
+
+class ScrapeScheduler:
+    """
+    Decides which result pages are due for a scrape.
+    Every fetch key starts at 'base_interval'. Scrapes that find new listings halve the interval,
+    scrapes without new listings stretch it, always within 'min_interval' and 'max_interval'.
+    The next due times are kept in a heap, outdated heap entries are skipped when they come up.
+    Each interval varies randomly by up to +-'jitter' and is counted from the due time, not from
+    the end of the scrape, so pages drift apart instead of being scraped in bursts.
+    'rescheduled' is set whenever a scrape moved a due time, so a caller waiting for the next due
+    page can wake up early when a busy page became due sooner.
+    """
+
+    def __init__(
+        self, base_interval: float, min_interval: float, max_interval: float, jitter: float
+    ) -> None:
+        self._base_interval = min(max(base_interval, min_interval), max_interval)
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._jitter = jitter
+        self._entries: dict[FetchKey, ScheduleEntry] = {}
+        self._due_heap: list[tuple[float, int, FetchKey]] = []
+        self._counter = itertools.count()  # Tie breaker, FetchKeys are not ordered
+        self.rescheduled = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def sync(
+        self, fetch_keys: set[FetchKey], spread: bool = False, now: float | None = None
+    ) -> None:
+        """
+        Adds fetch keys of new searches as due right away and forgets keys without searches.
+        With 'spread' the new keys are spread evenly over the first interval instead, e.g. at startup.
+        """
+        now = time.monotonic() if now is None else now
+        for fetch_key in self._entries.keys() - fetch_keys:
+            del self._entries[fetch_key]
+        new_keys = list(fetch_keys - self._entries.keys())
+        random.shuffle(new_keys)
+        for index, fetch_key in enumerate(new_keys):
+            due = now + self._base_interval * index / len(new_keys) if spread else now
+            self._schedule(fetch_key, ScheduleEntry(interval=self._base_interval, due=due))
+
+    def _schedule(self, fetch_key: FetchKey, entry: ScheduleEntry) -> None:
+        self._entries[fetch_key] = entry
+        heapq.heappush(self._due_heap, (entry.due, next(self._counter), fetch_key))
+
+    def pop_due(self, now: float | None = None) -> list[FetchKey]:
+        """Returns all fetch keys that are due. They are due again once 'record' was called."""
+        now = time.monotonic() if now is None else now
+        due_keys = []
+        while self._due_heap and self._due_heap[0][0] <= now:
+            due, _, fetch_key = heapq.heappop(self._due_heap)
+            entry = self._entries.get(fetch_key)
+            if entry is None or entry.due != due:
+                continue  # The key was removed or rescheduled in the meantime.
+            due_keys.append(fetch_key)
+        return due_keys
+
+    def time_until_next_due(self, now: float | None = None) -> float | None:
+        now = time.monotonic() if now is None else now
+        while self._due_heap:
+            due, _, fetch_key = self._due_heap[0]
+            entry = self._entries.get(fetch_key)
+            if entry is not None and entry.due == due:
+                return max(0.0, due - now)
+            heapq.heappop(self._due_heap)
+        return None
+
+    def record(self, fetch_key: FetchKey, new_items: int, now: float | None = None) -> None:
+        """Adapts the interval of a fetch key to the number of new listings of its last scrape."""
+        entry = self._entries.get(fetch_key)
+        if entry is None:
+            return
+        now = time.monotonic() if now is None else now
+        # On the first scrape every listing on the page is new, so it says nothing about the page.
+        if entry.scrapes > 0:
+            factor = SPEEDUP_FACTOR if new_items > 0 else BACKOFF_FACTOR
+            entry.interval = min(
+                max(entry.interval * factor, self._min_interval), self._max_interval
+            )
+        entry.scrapes += 1
+        entry.new_items += new_items
+        jittered_interval = entry.interval * random.uniform(1 - self._jitter, 1 + self._jitter)
+        # A scrape that had to wait or took long does not shift the period of the page.
+        entry.due = max(entry.due + jittered_interval, now)
+        self._schedule(fetch_key, entry)
+        self.rescheduled.set()
+        logger.debug(
+            f"{fetch_key} found {new_items} new listings, next scrape in {entry.interval:.0f} s."
+        )
+
+    def __str__(self) -> str:
+        if not self._entries:
+            return "0 result pages"
+        intervals = sorted(entry.interval for entry in self._entries.values())
+        return (
+            f"{len(intervals)} result pages, intervals min {intervals[0]:.0f} s / "
+            f"median {intervals[len(intervals) // 2]:.0f} s / max {intervals[-1]:.0f} s"
+        )
+
+
+scrape_scheduler = ScrapeScheduler(
+    base_interval=SCRAPE_INTERVAL,
+    min_interval=SCRAPE_MIN_INTERVAL,
+    max_interval=SCRAPE_MAX_INTERVAL,
+    jitter=SCRAPE_JITTER,
+)
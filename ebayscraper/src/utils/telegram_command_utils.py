@@ -55,7 +55,7 @@ async def init_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error("Error: effective_chat is None in init_command")
         return
     logger.info(f"Got init command from {update.effective_chat.id}")
-    search_values = extract_search_values(
+    search_values = await extract_search_values(
         chat_message=update.message.text, chat_id=update.effective_chat.id
     )
     if search_values is None:
@@ -117,7 +117,7 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error("Error: effective_chat is None in add_command")
         return
     logger.info(f"Got add command from {update.effective_chat.id}")
-    search_values = extract_search_values(
+    search_values = await extract_search_values(
         chat_message=update.message.text, chat_id=update.effective_chat.id
     )
     if search_values is None:
@@ -0,0 +1,114 @@
+import asyncio
+import gzip
+import json
+import zlib
+from collections.abc import Iterator
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@dataclass(slots=True)
+class RecordedResponse:
+    url: str
+    recorded_at: float  # Unix timestamp of the request
+    status: int
+    headers: dict[str, str]
+    text: str
+    elapsed: float  # Seconds the live request took
+
+
+def read_archive(path: str | Path) -> Iterator[RecordedResponse]:
+    """
+    Yields the responses of a traffic archive in the order they were recorded.
+    A record that was cut off because the bot did not shut down cleanly ends the archive.
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                yield RecordedResponse(**json.loads(line))
+    except (EOFError, zlib.error, json.JSONDecodeError) as e:
+        logger.warning(f"Traffic archive {path} ends with an incomplete record: {e}")
+
+
+class TrafficRecorder:
+    """
+    Appends every response to a gzip compressed JSON lines archive at 'path'.
+    Each record is flushed right away, so the archive stays readable if the bot is killed.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self._path = Path(path)
+        self._file: gzip.GzipFile | None = None
+        self.recorded = 0
+
+    def open(self) -> None:
+        if self._file is None:
+            # Appending adds a new gzip member, which gzip readers treat as one stream.
+            self._file = gzip.open(self._path, "ab")
+            logger.info(f"Recording HTTP traffic to {self._path}.")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info(f"Recorded {self.recorded} responses to {self._path}.")
+
+    def record(self, response: RecordedResponse) -> None:
+        if self._file is None:
+            raise RuntimeError("The traffic recorder is not open. Call 'open' first.")
+        line = json.dumps(asdict(response), ensure_ascii=False) + "\n"
+        self._file.write(line.encode("utf-8"))
+        self._file.flush()  # Sync flush, every complete line can be read back
+        self.recorded += 1
+
+
+class TrafficReplayer:
+    """
+    Serves the responses of a traffic archive instead of sending requests.
+    Every URL gets its recorded responses in the order they were recorded, the last one is repeated
+    once they are used up, like a page that stopped changing. With 'speed' 1 every response takes
+    as long as the live request did, 2 takes half as long and 0 answers right away.
+    """
+
+    def __init__(self, path: str | Path, speed: float) -> None:
+        self._path = Path(path)
+        self._speed = speed
+        self._responses: dict[str, list[RecordedResponse]] | None = None
+        self._positions: dict[str, int] = {}
+        self.replayed = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        if self._responses is not None:
+            return
+        self._responses = {}
+        for response in read_archive(self._path):
+            self._responses.setdefault(response.url, []).append(response)
+        logger.info(
+            f"Replaying {sum(len(responses) for responses in self._responses.values())} responses "
+            f"for {len(self._responses)} URLs from {self._path}."
+        )
+
+    async def get(self, url: str) -> RecordedResponse | None:
+        """Returns the next recorded response for 'url', or None if it was never recorded."""
+        if self._responses is None:
+            raise RuntimeError("The traffic archive is not loaded. Call 'load' first.")
+        responses = self._responses.get(url)
+        if not responses:
+            self.misses += 1
+            logger.warning(f"No recorded response for {url}")
+            return None
+        position = self._positions.get(url, 0)
+        self._positions[url] = min(position + 1, len(responses) - 1)
+        response = responses[position]
+        if self._speed > 0:
+            await asyncio.sleep(response.elapsed / self._speed)
+        self.replayed += 1
+        return response
+
+    def __str__(self) -> str:
+        return f"{self.replayed} responses replayed, {self.misses} URLs not in the archive"
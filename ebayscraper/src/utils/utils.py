@@ -1,14 +1,45 @@
+import re
+from collections import Counter
 from ebayscraper.src.classes import SearchRequest
-import aiohttp
-import json
-import urllib.parse
-import aiofiles
-from ebayscraper.src.utils.machine_learning import extract_search_values_with_ml
+from utils.llm_worker import llm_worker
+from utils.location_cache import location_cache
+from utils.extraction_cache import extraction_cache
 import logging
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+COMMAND_PATTERN = re.compile(r"^\s*/\w+")
+# Words around the price and the radius belong to the match, so they do not end up in the item name.
+# Dots only group thousands, "99.99 €" is left to the model instead of becoming 9999.
+PRICE_PATTERN = re.compile(
+    r"(?:\b(?:für|bis|unter|max(?:imal)?)\s+)?(?<![\d.,])(\d{1,3}(?:\.\d{3})+|\d+)(?:,\d{1,2})?"
+    r"\s*(?:€|euro\b|eur\b)",
+    re.IGNORECASE,
+)
+RADIUS_PATTERN = re.compile(
+    r"(?:\b(?:(?:im\s+)?(?:umkreis|radius)\s+(?:von\s+)?|mit\s+))?"
+    r"(\d+)\s*km\b(?:\s+(?:umkreis|radius)\b)?",
+    re.IGNORECASE,
+)
+# Up to three capitalized words like "Bad Homburg" or "Sankt Augustin", or "Frankfurt am Main".
+LOCATION_PATTERN = re.compile(
+    r"\bin\s+([A-ZÄÖÜ][\wäöüß-]*"
+    r"(?:\s+(?:am|an der|im)\s+[A-ZÄÖÜ][\wäöüß-]*|(?:\s+[A-ZÄÖÜ][\wäöüß-]*){0,2}))"
+)
+CAPITALIZED_WORD_PATTERN = re.compile(r"\s+[A-ZÄÖÜ]")
+# Phrases around the item name like "Ich suche nach einem ..." or "Ich möchte ein ... kaufen".
+LEADING_FILLER_PATTERN = re.compile(
+    r"^(?:ich\s+)?(?:suche|möchte|will|finde|brauche)(?:\s+nach)?(?:\s+(?:ein|eine|einen|einem|einer))?\s+",
+    re.IGNORECASE,
+)
+TRAILING_FILLER_PATTERN = re.compile(r"\s+(?:kaufen|haben)$", re.IGNORECASE)
+# Words that never belong to an item. "mit", "von" or "bis" do, e.g. "Tisch mit Stühlen".
+FILLER_WORDS = {"für", "in", "im", "umkreis", "radius"}
+
+# How often each layer of extract_search_values produced the search request.
+extraction_layer_counts: Counter[str] = Counter()
+
 
 def replace_umlauts(string: str) -> str:
     string = string.replace("ä", "ae")
@@ -18,6 +49,20 @@ def replace_umlauts(string: str) -> str:
     return string
 
 
+def normalize_location(location: str) -> str:
+    """
+    Brings a location into the form used in the scrape URL and the location cache.
+    """
+    return replace_umlauts(location).lower().strip().replace(" ", "-")
+
+
+def normalize_message(message: str) -> str:
+    """
+    Brings messages that only differ in the command, case, whitespace or umlauts into the same form.
+    """
+    return " ".join(replace_umlauts(COMMAND_PATTERN.sub("", message).lower()).split())
+
+
 # Get values from the incoming telegram message using the /init command
 def parse_search_schema_message(chat_id: int, message: str) -> SearchRequest | None:
     message_parts = message.split(",")
@@ -84,34 +129,100 @@ def parse_price_to_int(price: str) -> int:
 
 
 async def get_location_id(location: str) -> str | None:
-    async with aiofiles.open("./location_ids.json", "r") as file:
-        content = await file.read()
-        location_ids = json.loads(content)
-    if location in location_ids:
-        logger.debug(f"Cache hit for '{location}'")
-        return location_ids[location]
-    url = f"https://www.kleinanzeigen.de/s-ort-empfehlungen.json?query={urllib.parse.quote_plus(location)}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                keys = list(data.keys())
-                if len(keys) < 2:
-                    logger.info(f"Location '{location}' not found.")
-                    return None
-                location_id = str(keys[1]).replace(
-                    "_", "l"
-                )  # Get the second key from the dictionary which corresponds to the location. The first is germany.
-                # The locations is returned as _299424, so we need to replace the _ with l.
-                location_ids[location] = location_id
-                content_to_write = json.dumps(location_ids, indent=4, ensure_ascii=False)
-                async with aiofiles.open("./location_ids.json", "w") as file:
-                    await file.write(content_to_write)
-                logger.info(f"Cache updated for '{location}' with ID '{location_id}'")
-                return location_id
-            else:
-                logger.error(f"Error fetching location ID for '{location}': {response.status}")
-                return None
+    return await location_cache.get(location)
+
+
+def cut_match(text: str, match: re.Match) -> str:
+    """Replaces a match with a comma, so the text around it stays in separate segments."""
+    return f"{text[: match.start()]},{text[match.end() :]}"
+
+
+def is_place_name(segment: str) -> bool:
+    words = segment.split()
+    return 0 < len(words) <= 3 and all(
+        word[0].isupper() and not any(character.isdigit() for character in word) for word in words
+    )
+
+
+def find_location(
+    text: str, known_locations: set[str], first_place_segment: int
+) -> tuple[str | None, str]:
+    """
+    Picks the location from the 'in <Place>' phrases and the segments from 'first_place_segment' on
+    that look like a place name, e.g. ", Berlin,".
+    Returns the location and the text without it, or None if the location is ambiguous.
+    Every German noun is capitalized, so "in Schwarz" or "in Größe 42" look like places as well:
+    a known location always wins, otherwise the last 'in <Place>' is used, and a place name segment
+    only if there is nothing else to choose from.
+    """
+    location_matches = list(LOCATION_PATTERN.finditer(text))
+    if any(
+        CAPITALIZED_WORD_PATTERN.match(text, location_match.end())
+        for location_match in location_matches
+    ):
+        return None, text  # Longer than any place name the pattern takes, e.g. four words.
+    segments = text.split(",")
+    place_segments = [
+        index
+        for index in range(first_place_segment, len(segments))
+        if is_place_name(segments[index])
+    ]
+    for location_match in reversed(location_matches):
+        if normalize_location(location_match.group(1)) in known_locations:
+            return location_match.group(1), cut_match(text, location_match)
+    for index in place_segments:
+        if normalize_location(segments[index]) in known_locations:
+            return segments[index].strip(), ",".join(segments[:index] + segments[index + 1 :])
+    if location_matches and not place_segments:
+        return location_matches[-1].group(1), cut_match(text, location_matches[-1])
+    if len(place_segments) == 1 and not location_matches:
+        index = place_segments[0]
+        return segments[index].strip(), ",".join(segments[:index] + segments[index + 1 :])
+    return None, text
+
+
+def parse_free_text_message(
+    chat_id: int, message: str, known_locations: set[str]
+) -> SearchRequest | None:
+    """
+    Rule based extraction for free text messages like "iPhone 12 für 500 Euro in Berlin 30 km"
+    or "Suche ein iPhone 12, 500 Euro, Berlin, 30km".
+    Returns None unless item, price, location and radius were all recognized without doubt.
+    """
+    # Price and radius are matched before the message is split, "1.299,99 €" contains a comma.
+    text = COMMAND_PATTERN.sub("", message)
+    price_match = PRICE_PATTERN.search(text)
+    if price_match is None:
+        return None
+    price = int(price_match.group(1).replace(".", ""))
+    # Segments in front of the price describe the item, e.g. "Rad, Mountainbike, 500 Euro, Berlin".
+    first_place_segment = text[: price_match.start()].count(",") + 1
+    text = cut_match(text, price_match)
+    radius_match = RADIUS_PATTERN.search(text)
+    if radius_match is None:
+        return None
+    radius = int(radius_match.group(1))
+    if radius_match.start() < price_match.start():
+        first_place_segment += 1  # The radius was cut out in front of the price.
+    text = cut_match(text, radius_match)
+    location, text = find_location(text, known_locations, first_place_segment)
+    if location is None:
+        return None
+
+    name_parts = []
+    for segment in text.split(","):
+        segment = TRAILING_FILLER_PATTERN.sub("", LEADING_FILLER_PATTERN.sub("", segment.strip()))
+        words = [word.strip(".!?;:") for word in segment.split()]
+        name_parts.extend(word for word in words if word and word.lower() not in FILLER_WORDS)
+    if not name_parts:
+        return None
+    return SearchRequest(
+        chat_id=chat_id,
+        item_name=replace_umlauts(" ".join(name_parts).lower()),
+        price_limit=price,
+        location=replace_umlauts(location.strip().lower()),
+        radius=radius,
+    )
 
 
 def is_schema_format(string: str) -> bool:
@@ -123,13 +234,43 @@ def is_schema_format(string: str) -> bool:
     return False
 
 
-def extract_search_values(chat_message: str, chat_id: int) -> SearchRequest | None:
+def parse_with_rules(chat_id: int, chat_message: str) -> tuple[str, SearchRequest | None]:
+    """
+    Tries the layers that do not need the model: the schema format first, then the free text rules.
+    Returns the name of the layer that succeeded, or "llm" if the model is needed.
+    """
     if is_schema_format(chat_message):
-        logger.info("Using schema format to extract search values.")
-        search_values = parse_search_schema_message(chat_id, chat_message)
-    else:
-        logger.info("Using machine learning model to extract search values.")
-        search_values = extract_search_values_with_ml(chat_id=chat_id, chat_message=chat_message)
+        try:
+            search_values = parse_search_schema_message(chat_id, chat_message)
+        except (ValueError, IndexError):
+            search_values = None  # Four parts, but not in the order of the schema.
+        if search_values is not None:
+            return "schema", search_values
+    search_values = parse_free_text_message(
+        chat_id, chat_message, known_locations=location_cache.known_locations()
+    )
+    if search_values is not None:
+        return "rules", search_values
+    return "llm", None
+
+
+async def extract_search_values(chat_message: str, chat_id: int) -> SearchRequest | None:
+    layer, search_values = parse_with_rules(chat_id=chat_id, chat_message=chat_message)
+    if layer == "llm":
+        cache_key = normalize_message(chat_message)
+        search_values = extraction_cache.get(chat_id=chat_id, key=cache_key)
+        if search_values is not None:
+            layer = "cache"
+        else:
+            search_values = await llm_worker.extract(chat_id=chat_id, chat_message=chat_message)
+            if search_values is not None:
+                extraction_cache.add(key=cache_key, search_request=search_values)
+            logger.info(f"LLM worker: {llm_worker}")
+        logger.info(f"Extraction cache: {extraction_cache}")
+    extraction_layer_counts[layer] += 1
+    logger.info(
+        f"Used the {layer} layer to extract search values. Layers used so far: {dict(extraction_layer_counts)}"
+    )
     if search_values is None:
         logger.error("Error: Could not extract search values from message.")
         return None
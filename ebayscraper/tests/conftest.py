@@ -0,0 +1,9 @@
+"""
+The bot imports its modules as 'utils.xxx' and 'constants' from ebayscraper/src, and the constants
+read the config.json in the working directory, so run the tests from a directory with a config.json.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,74 @@
+import pytest
+from utils.utils import parse_free_text_message
+
+
+@pytest.mark.parametrize(
+    "message, known_locations, expected",
+    [
+        ("Sofa für 1.299,99 € in Köln 20 km", set(), ("sofa", 1299, "koeln", 20)),
+        ("Kinderwagen 100,50 € in München 5 km", set(), ("kinderwagen", 100, "muenchen", 5)),
+        (
+            "Jacke in Schwarz, 80 Euro, Hamburg, 10km",
+            {"hamburg"},
+            ("jacke-schwarz", 80, "hamburg", 10),
+        ),
+        (
+            "Schuhe in Größe 42 für 50 Euro in Berlin 10 km",
+            set(),
+            ("schuhe-groesse-42", 50, "berlin", 10),
+        ),
+        (
+            "Tisch mit Stühlen für 100 Euro in Berlin im Umkreis von 10 km",
+            set(),
+            ("tisch-mit-stuehlen", 100, "berlin", 10),
+        ),
+        (
+            "Suche ein iPhone 12, 500 Euro, Berlin, 30km",
+            set(),
+            ("iphone-12", 500, "berlin", 30),
+        ),
+        (
+            "Ich möchte ein Fahrrad kaufen, Mountainbike, 500 Euro, Frankfurt, 25km",
+            set(),
+            ("fahrrad-mountainbike", 500, "frankfurt", 25),
+        ),
+        ("Fahrrad für 200 Euro in Bad Homburg 20 km", set(), ("fahrrad", 200, "bad homburg", 20)),
+        ("Sofa für 300 Euro in Sankt Augustin 10km", set(), ("sofa", 300, "sankt augustin", 10)),
+        ("Lampe für 20 Euro in Neu Isenburg 5 km", set(), ("lampe", 20, "neu isenburg", 5)),
+        (
+            "Tisch für 50 Euro in Frankfurt am Main 10 km",
+            set(),
+            ("tisch", 50, "frankfurt am main", 10),
+        ),
+        ("Kopfhörer für 99,99 € in Berlin 10 km", set(), ("kopfhoerer", 99, "berlin", 10)),
+    ],
+)
+def test_free_text_message(message, known_locations, expected):
+    search_request = parse_free_text_message(
+        chat_id=1, message=f"/add {message}", known_locations=known_locations
+    )
+    assert search_request is not None
+    assert (
+        search_request.item_name,
+        search_request.price_limit,
+        search_request.location,
+        search_request.radius,
+    ) == expected
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        # "in Schwarz" and "Hamburg" both look like places and neither is known.
+        "Jacke in Schwarz, 80 Euro, Hamburg, 10km",
+        "iPhone 12 in Berlin 30 km",
+        "iPhone 12 für 500 Euro in Berlin",
+        # Four capitalized words are longer than any place name the rules take.
+        "Fahrrad für 200 Euro in Bad Homburg Vor Höhe 20 km",
+        # A dot only groups thousands, 99.99 € is not 9999 €.
+        "Kopfhörer für 99.99 € in Berlin 10 km",
+        "Kopfhörer für 1299.99 € in Berlin 10 km",
+    ],
+)
+def test_free_text_message_falls_back_to_llm(message):
+    assert parse_free_text_message(chat_id=1, message=message, known_locations=set()) is None
@@ -0,0 +1,36 @@
+from pathlib import Path
+import pytest
+from utils.parsers import PARSER_BACKENDS, BeautifulSoupParser
+
+RESULT_PAGE = Path(__file__).resolve().parent / "fixtures" / "result_page.html"
+OPTIONAL_BACKENDS = {"lxml": "lxml.html", "selectolax": "selectolax.lexbor"}
+
+
+def parse_fixture(backend_name: str) -> list[tuple]:
+    parser = PARSER_BACKENDS[backend_name]()
+    items = parser.parse(RESULT_PAGE.read_text(encoding="utf-8"))
+    # last_seen_date is the time of parsing, everything else comes from the page.
+    return [(item.item_name, item.identifier, item.url, item.price) for item in items]
+
+
+def test_html_parser_reads_every_listing():
+    assert [identifier for _, identifier, _, _ in parse_fixture(BeautifulSoupParser.name)] == [
+        "2871234567-88-945",
+        "2871234568-88-945",
+        "2871234569-88-945",
+        "2871234570-88-945",
+        "2871234571-88-945",
+    ]
+    assert [price for _, _, _, price in parse_fixture(BeautifulSoupParser.name)] == [
+        1250,
+        0,
+        450,
+        0,
+        0,
+    ]
+
+
+@pytest.mark.parametrize("backend_name", sorted(OPTIONAL_BACKENDS))
+def test_backends_yield_the_same_items(backend_name):
+    pytest.importorskip(OPTIONAL_BACKENDS[backend_name])
+    assert parse_fixture(backend_name) == parse_fixture(BeautifulSoupParser.name)
@@ -0,0 +1,59 @@
+import asyncio
+import time
+from ebayscraper.src.classes import FetchKey
+from utils.scheduler import ScrapeScheduler
+
+FETCH_KEY = FetchKey(item_name="ps5", location="berlin", radius=10)
+
+
+def test_busy_page_speeds_up_to_min_interval():
+    scheduler = ScrapeScheduler(base_interval=4, min_interval=1, max_interval=60, jitter=0)
+    scheduler.sync({FETCH_KEY}, now=0)
+    now = 0.0
+    periods = []
+    for _ in range(4):
+        assert scheduler.pop_due(now=now) == [FETCH_KEY]
+        scheduler.record(FETCH_KEY, new_items=3, now=now)
+        periods.append(scheduler.time_until_next_due(now=now))
+        now += periods[-1]
+    # The first scrape says nothing about the page, the next ones halve the interval.
+    assert periods == [4, 2, 1, 1]
+
+
+def test_record_wakes_up_a_waiting_scraper():
+    """
+    The scraper waits until the next due page at most. A page that is being scraped is not in the
+    schedule, so it only learns of the earlier due time of a busy page through 'rescheduled'.
+    """
+    scheduler = ScrapeScheduler(base_interval=0.2, min_interval=0.1, max_interval=60, jitter=0)
+    scheduler.sync({FETCH_KEY})
+
+    async def scrape_cycle() -> list[float]:
+        scraped_at = []
+        scrape_tasks = set()
+        started = time.monotonic()
+
+        async def scrape(fetch_key: FetchKey) -> None:
+            await asyncio.sleep(0.01)
+            scheduler.record(fetch_key, new_items=1)
+
+        while time.monotonic() - started < 0.6:
+            for fetch_key in scheduler.pop_due():
+                scraped_at.append(time.monotonic())
+                task = asyncio.create_task(scrape(fetch_key))
+                scrape_tasks.add(task)
+                task.add_done_callback(scrape_tasks.discard)
+            scheduler.rescheduled.clear()
+            sleep_time = 4.0
+            next_due = scheduler.time_until_next_due()
+            if next_due is not None:
+                sleep_time = min(sleep_time, next_due)
+            try:
+                await asyncio.wait_for(scheduler.rescheduled.wait(), sleep_time)
+            except asyncio.TimeoutError:
+                pass
+        return scraped_at
+
+    scraped_at = asyncio.run(scrape_cycle())
+    # Without the wake up the scraper would sleep for 4 s after the second scrape.
+    assert len(scraped_at) >= 4